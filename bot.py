@@ -44,7 +44,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat = update.effective_chat
     
     # Register user in the database using UserService
-    success = user_service.register_user(
+    success = await user_service.register_user(
         user_id=user.id,
         username=user.username,
         first_name=user.first_name,
@@ -606,8 +606,8 @@ async def history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     chat = update.effective_chat
     
-    # Get weekly stats from database (get more for pagination)
-    weekly_stats = db_manager.get_user_stats_history_in_chat(user.id, chat.id, limit=50)
+    # Get weekly stats (get more for pagination)
+    weekly_stats = statistics_service.get_stats_history(user.id, chat.id, limit=50)
     
     if not weekly_stats:
         await update.message.reply_text("You don't have any historical statistics yet.")
@@ -763,9 +763,10 @@ def main() -> None:
 
 def shutdown():
     """Shutdown the bot and scheduler."""
-    if scheduler.scheduler.running:
+    if scheduler.running:
         scheduler.shutdown()
         logger.info("Scheduler shutdown")
+    db_manager.close()
 
 if __name__ == '__main__':
     try:
@@ -34,6 +34,16 @@ TASK_STATUS = {
 MIN_TASKS_PER_WEEK = 3
 MAX_TASKS_PER_WEEK = 5
 
+# Statistics generation
+STATS_MAX_WORKERS = 8  # Chats processed concurrently by the weekly stats job
+STATS_CACHE_SIZE = 2048  # Statistics reads kept in memory
+STATS_CACHE_TTL = 60  # Seconds a cached statistics read stays valid
+
+# User lookups cache
+USER_CACHE_SIZE = 10000  # Users and registrations kept in memory
+USER_CACHE_TTL = 300  # Seconds a cached user lookup stays valid
+USER_NEGATIVE_CACHE_TTL = 30  # Seconds a "not registered" result stays valid
+
 # Schedule times (UTC+3)
 WEEKLY_STATS_DAY = 'friday'
 WEEKLY_STATS_HOUR = 17
@@ -1,6 +1,9 @@
 import sqlite3
 import os
 import logging
+import pathlib
+import queue
+import threading
 from typing import List, Optional, Tuple, Dict, Any
 import datetime
 
@@ -9,14 +12,39 @@ import config
 
 logger = logging.getLogger(__name__)
 
+# Number of prepared statements SQLite keeps per connection
+STATEMENT_CACHE_SIZE = 256
+
+# SQL for the hot getters, shared so the query text isn't duplicated
+SQL_GET_USER = "SELECT * FROM users WHERE user_id = ?"
+SQL_GET_CHAT = "SELECT * FROM chats WHERE chat_id = ?"
+SQL_GET_USER_CHAT = "SELECT * FROM user_chats WHERE user_id = ? AND chat_id = ?"
+SQL_GET_WEEKLY_STAT = (
+    "SELECT * FROM weekly_stats "
+    "WHERE user_id = ? AND chat_id = ? AND week_number = ? AND year = ?"
+)
+
+# Applied to every new connection; WAL lets readers run alongside the writer
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Read-only connections kept open next to the single writer connection
+READER_POOL_SIZE = 4
+
 class DatabaseManager:
     """Manager for SQLite database operations."""
     
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, reader_pool_size: int = READER_POOL_SIZE):
         """Initialize the database manager.
         
         Args:
             db_path: Path to the SQLite database file. If None, uses the path from config.
+            reader_pool_size: Number of read-only connections used by the getters.
         """
         if db_path is None:
             # Extract the database path from the SQLite URI in config
@@ -27,33 +55,106 @@ class DatabaseManager:
                 db_path = 'taskbot.db'
         
         self.db_path = db_path
-        self.conn = None
-        self.cursor = None
+        # The operation in progress on each thread uses its own cursor
+        self._local = threading.local()
         
         # Ensure the database directory exists
         db_dir = os.path.dirname(os.path.abspath(self.db_path))
         if db_dir and db_dir != '.':
             os.makedirs(db_dir, exist_ok=True)
         
+        # SQLite allows a single writer and many readers: writes share one
+        # connection guarded by a lock, reads take a connection from the pool
+        self._write_lock = threading.RLock()
+        self._writer_conn = self._open_connection()
+        
         # Initialize the database
         self._init_db()
+        
+        # An in-memory database is private to its connection, so reads use the writer
+        self._reader_pool = None
+        if self.db_path != ':memory:' and reader_pool_size > 0:
+            self._reader_pool = queue.Queue(maxsize=reader_pool_size)
+            for _ in range(reader_pool_size):
+                self._reader_pool.put(self._open_connection(read_only=True))
     
-    def _connect(self):
-        """Connect to the SQLite database."""
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The writer connection."""
+        return self._writer_conn
+    
+    @property
+    def cursor(self) -> Optional[sqlite3.Cursor]:
+        """Cursor of the operation in progress on the current thread."""
+        return getattr(self._local, 'cursor', None)
+    
+    @cursor.setter
+    def cursor(self, value: Optional[sqlite3.Cursor]):
+        self._local.cursor = value
+    
+    def _open_connection(self, read_only: bool = False) -> sqlite3.Connection:
+        """Open a new connection to the SQLite database.
+        
+        Connections stay open for the lifetime of the manager, so SQLite's
+        prepared statement cache survives between calls.
+        """
         try:
-            self.conn = sqlite3.connect(self.db_path)
-            self.conn.row_factory = sqlite3.Row
-            self.cursor = self.conn.cursor()
+            if read_only:
+                uri = pathlib.Path(os.path.abspath(self.db_path)).as_uri() + '?mode=ro'
+                conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                                       cached_statements=STATEMENT_CACHE_SIZE)
+            else:
+                conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                                       cached_statements=STATEMENT_CACHE_SIZE)
+                if self.db_path != ':memory:':
+                    conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            return conn
         except sqlite3.Error as e:
             logger.error(f"Error connecting to database: {e}")
             raise
     
+    def _connect(self, read_only: bool = False):
+        """Acquire a connection for the current operation.
+        
+        Args:
+            read_only: If True, take a connection from the reader pool instead
+                of locking the writer connection.
+        """
+        if read_only and self._reader_pool is not None:
+            conn = self._reader_pool.get()
+        else:
+            self._write_lock.acquire()
+            conn = self._writer_conn
+        self._local.conn = conn
+        self.cursor = conn.cursor()
+    
     def _disconnect(self):
-        """Disconnect from the SQLite database."""
-        if self.conn:
-            self.conn.close()
-            self.conn = None
-            self.cursor = None
+        """Release the connection of the current operation.
+        
+        Changes that were not committed are rolled back.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        self.cursor = None
+        
+        if conn is self._writer_conn:
+            if conn.in_transaction:
+                conn.rollback()
+            self._write_lock.release()
+        else:
+            self._reader_pool.put(conn)
+    
+    def close(self):
+        """Close all database connections."""
+        if self._reader_pool is not None:
+            while not self._reader_pool.empty():
+                self._reader_pool.get_nowait().close()
+        self._writer_conn.close()
     
     def _init_db(self):
         """Initialize the database with required tables if they don't exist."""
@@ -130,6 +231,54 @@ class DatabaseManager:
                 )
             ''')
             
+            # Create weekly_stats_archive table for statistics of finished weeks
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS weekly_stats_archive (
+                    stat_id INTEGER PRIMARY KEY,
+                    user_id INTEGER,
+                    chat_id INTEGER,
+                    week_number INTEGER,
+                    year INTEGER,
+                    tasks_created INTEGER,
+                    tasks_completed INTEGER,
+                    tasks_canceled INTEGER,
+                    completion_rate REAL,
+                    FOREIGN KEY (user_id) REFERENCES users (user_id),
+                    FOREIGN KEY (chat_id) REFERENCES chats (chat_id)
+                )
+            ''')
+            
+            # Covering index for the per-chat weekly task queries and aggregation
+            self.cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_tasks_chat_week_user_status
+                ON tasks (chat_id, week_number, year, user_id, status)
+            ''')
+            
+            # Index for listing a user's active chats; covers the join to chats
+            self.cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_user_chats_user_active
+                ON user_chats (user_id, is_active, chat_id)
+            ''')
+            
+            # One statistics row per user, chat and week; also the upsert conflict target
+            self.cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_weekly_stats_user_chat_week
+                ON weekly_stats (user_id, chat_id, week_number, year)
+            ''')
+            
+            # Index for weekly statistics lookups by chat and week
+            self.cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_weekly_stats_chat_week
+                ON weekly_stats (chat_id, week_number, year)
+            ''')
+            
+            # One archived row per user, chat and week, so archiving a week again
+            # replaces its rows; also serves statistics history lookups
+            self.cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_weekly_stats_archive_user_chat_week
+                ON weekly_stats_archive (user_id, chat_id, week_number, year)
+            ''')
+            
             self.conn.commit()
             logger.info("Database initialized successfully")
         except sqlite3.Error as e:
@@ -143,14 +292,11 @@ class DatabaseManager:
     def get_user(self, user_id: int) -> Optional[User]:
         """Get a user by ID."""
         try:
-            self._connect()
-            self.cursor.execute(
-                "SELECT * FROM users WHERE user_id = ?",
-                (user_id,)
-            )
+            self._connect(read_only=True)
+            self.cursor.execute(SQL_GET_USER, (user_id,))
             row = self.cursor.fetchone()
             if row:
-                return User.from_row(tuple(row))
+                return User.from_row(row)
             return None
         except sqlite3.Error as e:
             logger.error(f"Error getting user {user_id}: {e}")
@@ -215,14 +361,11 @@ class DatabaseManager:
     def get_chat(self, chat_id: int) -> Optional[Chat]:
         """Get a chat by ID."""
         try:
-            self._connect()
-            self.cursor.execute(
-                "SELECT * FROM chats WHERE chat_id = ?",
-                (chat_id,)
-            )
+            self._connect(read_only=True)
+            self.cursor.execute(SQL_GET_CHAT, (chat_id,))
             row = self.cursor.fetchone()
             if row:
-                return Chat.from_row(tuple(row))
+                return Chat.from_row(row)
             return None
         except sqlite3.Error as e:
             logger.error(f"Error getting chat {chat_id}: {e}")
@@ -285,14 +428,11 @@ class DatabaseManager:
     def get_user_chat(self, user_id: int, chat_id: int) -> Optional[UserChat]:
         """Get a user-chat association."""
         try:
-            self._connect()
-            self.cursor.execute(
-                "SELECT * FROM user_chats WHERE user_id = ? AND chat_id = ?",
-                (user_id, chat_id)
-            )
+            self._connect(read_only=True)
+            self.cursor.execute(SQL_GET_USER_CHAT, (user_id, chat_id))
             row = self.cursor.fetchone()
             if row:
-                return UserChat.from_row(tuple(row))
+                return UserChat.from_row(row)
             return None
         except sqlite3.Error as e:
             logger.error(f"Error getting user-chat for user {user_id} and chat {chat_id}: {e}")
@@ -351,7 +491,7 @@ class DatabaseManager:
     def get_user_chats(self, user_id: int) -> List[Chat]:
         """Get all chats for a user."""
         try:
-            self._connect()
+            self._connect(read_only=True)
             self.cursor.execute(
                 """
                 SELECT c.* FROM chats c
@@ -361,7 +501,7 @@ class DatabaseManager:
                 (user_id,)
             )
             rows = self.cursor.fetchall()
-            return [Chat.from_row(tuple(row)) for row in rows]
+            return [Chat.from_row(row) for row in rows]
         except sqlite3.Error as e:
             logger.error(f"Error getting chats for user {user_id}: {e}")
             return []
@@ -371,12 +511,12 @@ class DatabaseManager:
     def get_all_active_chats(self) -> List[Chat]:
         """Get all active chats."""
         try:
-            self._connect()
+            self._connect(read_only=True)
             self.cursor.execute(
                 "SELECT * FROM chats WHERE is_active = 1"
             )
             rows = self.cursor.fetchall()
-            return [Chat.from_row(tuple(row)) for row in rows]
+            return [Chat.from_row(row) for row in rows]
         except sqlite3.Error as e:
             logger.error(f"Error getting all active chats: {e}")
             return []
@@ -386,7 +526,7 @@ class DatabaseManager:
     def get_chat_users(self, chat_id: int) -> List[User]:
         """Get all users in a chat."""
         try:
-            self._connect()
+            self._connect(read_only=True)
             self.cursor.execute(
                 """
                 SELECT u.* FROM users u
@@ -396,7 +536,7 @@ class DatabaseManager:
                 (chat_id,)
             )
             rows = self.cursor.fetchall()
-            return [User.from_row(tuple(row)) for row in rows]
+            return [User.from_row(row) for row in rows]
         except sqlite3.Error as e:
             logger.error(f"Error getting users for chat {chat_id}: {e}")
             return []
@@ -408,14 +548,14 @@ class DatabaseManager:
     def get_task(self, task_id: int) -> Optional[Task]:
         """Get a task by ID."""
         try:
-            self._connect()
+            self._connect(read_only=True)
             self.cursor.execute(
                 "SELECT * FROM tasks WHERE task_id = ?",
                 (task_id,)
             )
             row = self.cursor.fetchone()
             if row:
-                return Task.from_row(tuple(row))
+                return Task.from_row(row)
             return None
         except sqlite3.Error as e:
             logger.error(f"Error getting task {task_id}: {e}")
@@ -426,7 +566,7 @@ class DatabaseManager:
     def get_user_tasks_in_chat(self, user_id: int, chat_id: int, week_number: Optional[int] = None, year: Optional[int] = None) -> List[Task]:
         """Get tasks for a user in a specific chat, optionally filtered by week."""
         try:
-            self._connect()
+            self._connect(read_only=True)
             query = "SELECT * FROM tasks WHERE user_id = ? AND chat_id = ?"
             params = [user_id, chat_id]
             
@@ -436,7 +576,7 @@ class DatabaseManager:
             
             self.cursor.execute(query, params)
             rows = self.cursor.fetchall()
-            return [Task.from_row(tuple(row)) for row in rows]
+            return [Task.from_row(row) for row in rows]
         except sqlite3.Error as e:
             logger.error(f"Error getting tasks for user {user_id} in chat {chat_id}: {e}")
             return []
@@ -471,6 +611,46 @@ class DatabaseManager:
         finally:
             self._disconnect()
     
+    def create_tasks(self, tasks: List[Task]) -> List[int]:
+        """Create several tasks in a single transaction.
+        
+        Returns:
+            IDs of the created tasks in the order given, or an empty list on error.
+        """
+        if not tasks:
+            return []
+        try:
+            self._connect()
+            self.cursor.executemany(
+                """
+                INSERT INTO tasks (user_id, chat_id, description, status, created_at, updated_at, week_number, year)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        task.user_id,
+                        task.chat_id,
+                        task.description,
+                        task.status,
+                        task.created_at.isoformat() if task.created_at else None,
+                        task.updated_at.isoformat() if task.updated_at else None,
+                        task.week_number,
+                        task.year
+                    )
+                    for task in tasks
+                ]
+            )
+            # Rows from one executemany under the write lock get consecutive IDs
+            self.cursor.execute("SELECT last_insert_rowid()")
+            last_id = self.cursor.fetchone()[0]
+            self.conn.commit()
+            return list(range(last_id - len(tasks) + 1, last_id + 1))
+        except sqlite3.Error as e:
+            logger.error(f"Error creating {len(tasks)} tasks: {e}")
+            return []
+        finally:
+            self._disconnect()
+    
     def update_task(self, task: Task) -> bool:
         """Update an existing task."""
         try:
@@ -515,7 +695,7 @@ class DatabaseManager:
     def count_user_tasks_in_chat(self, user_id: int, chat_id: int, week_number: int, year: int) -> int:
         """Count the number of tasks for a user in a specific chat and week."""
         try:
-            self._connect()
+            self._connect(read_only=True)
             self.cursor.execute(
                 """
                 SELECT COUNT(*) FROM tasks
@@ -531,22 +711,77 @@ class DatabaseManager:
         finally:
             self._disconnect()
     
+    def count_chat_tasks_by_user(self, chat_id: int, week_number: int, year: int) -> Dict[int, Tuple[int, int, int, float]]:
+        """Count tasks by status for every user in a chat and week.
+        
+        Returns:
+            Dictionary mapping user IDs to (created, completed, canceled, completion_rate).
+            Users without tasks in the week are not included.
+        """
+        try:
+            self._connect(read_only=True)
+            self.cursor.execute(
+                """
+                SELECT user_id,
+                       COUNT(*),
+                       SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END),
+                       SUM(CASE WHEN status = 'canceled' THEN 1 ELSE 0 END),
+                       CAST(SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) AS REAL) / NULLIF(COUNT(*), 0)
+                FROM tasks
+                WHERE chat_id = ? AND week_number = ? AND year = ?
+                GROUP BY user_id
+                """,
+                (chat_id, week_number, year)
+            )
+            rows = self.cursor.fetchall()
+            return {row[0]: (row[1], row[2], row[3], row[4] or 0.0) for row in rows}
+        except sqlite3.Error as e:
+            logger.error(f"Error counting tasks by user in chat {chat_id}: {e}")
+            return {}
+        finally:
+            self._disconnect()
+    
     # Weekly stats operations
     
-    def get_weekly_stat(self, user_id: int, chat_id: int, week_number: int, year: int) -> Optional[WeeklyStat]:
-        """Get weekly statistics for a user in a specific chat."""
+    def get_user_stats_bundle(self, user_id: int, chat_id: int, week_number: int, year: int) -> Optional[Tuple]:
+        """Get a user's weekly statistics in a chat together with the user and chat existence check.
+        
+        Returns:
+            Tuple of (user_id, chat_id, stat_id, tasks_created, tasks_completed, tasks_canceled),
+            where the statistics columns are None if there are no statistics for the week,
+            or None if the user or the chat does not exist.
+        """
         try:
-            self._connect()
+            self._connect(read_only=True)
             self.cursor.execute(
                 """
-                SELECT * FROM weekly_stats
-                WHERE user_id = ? AND chat_id = ? AND week_number = ? AND year = ?
+                SELECT u.user_id, c.chat_id, ws.stat_id, ws.tasks_created, ws.tasks_completed, ws.tasks_canceled
+                FROM users u
+                JOIN chats c ON c.chat_id = ?
+                LEFT JOIN weekly_stats ws
+                    ON ws.user_id = u.user_id AND ws.chat_id = c.chat_id AND ws.week_number = ? AND ws.year = ?
+                WHERE u.user_id = ?
                 """,
-                (user_id, chat_id, week_number, year)
+                (chat_id, week_number, year, user_id)
             )
             row = self.cursor.fetchone()
             if row:
-                return WeeklyStat.from_row(tuple(row))
+                return tuple(row)
+            return None
+        except sqlite3.Error as e:
+            logger.error(f"Error getting stats bundle for user {user_id} in chat {chat_id}: {e}")
+            return None
+        finally:
+            self._disconnect()
+    
+    def get_weekly_stat(self, user_id: int, chat_id: int, week_number: int, year: int) -> Optional[WeeklyStat]:
+        """Get weekly statistics for a user in a specific chat."""
+        try:
+            self._connect(read_only=True)
+            self.cursor.execute(SQL_GET_WEEKLY_STAT, (user_id, chat_id, week_number, year))
+            row = self.cursor.fetchone()
+            if row:
+                return WeeklyStat.from_row(row)
             return None
         except sqlite3.Error as e:
             logger.error(f"Error getting weekly stats for user {user_id} in chat {chat_id}: {e}")
@@ -555,20 +790,23 @@ class DatabaseManager:
             self._disconnect()
     
     def get_user_stats_history_in_chat(self, user_id: int, chat_id: int, limit: int = 10) -> List[WeeklyStat]:
-        """Get historical weekly statistics for a user in a specific chat."""
+        """Get historical weekly statistics for a user in a specific chat, including archived weeks."""
         try:
-            self._connect()
+            self._connect(read_only=True)
             self.cursor.execute(
                 """
                 SELECT * FROM weekly_stats
                 WHERE user_id = ? AND chat_id = ?
+                UNION ALL
+                SELECT * FROM weekly_stats_archive
+                WHERE user_id = ? AND chat_id = ?
                 ORDER BY year DESC, week_number DESC
                 LIMIT ?
                 """,
-                (user_id, chat_id, limit)
+                (user_id, chat_id, user_id, chat_id, limit)
             )
             rows = self.cursor.fetchall()
-            return [WeeklyStat.from_row(tuple(row)) for row in rows]
+            return [WeeklyStat.from_row(row) for row in rows]
         except sqlite3.Error as e:
             logger.error(f"Error getting stats history for user {user_id} in chat {chat_id}: {e}")
             return []
@@ -577,39 +815,24 @@ class DatabaseManager:
     
     def create_or_update_weekly_stat(self, stat: WeeklyStat) -> bool:
         """Create or update weekly statistics for a user in a specific chat."""
+        return self.bulk_upsert_weekly_stats([stat])
+    
+    def bulk_upsert_weekly_stats(self, stats: List[WeeklyStat]) -> bool:
+        """Create or update weekly statistics for several users in a single transaction."""
         try:
             self._connect()
-            
-            # Check if stats exist for this user, chat, week, and year
-            existing_stat = self.get_weekly_stat(stat.user_id, stat.chat_id, stat.week_number, stat.year)
-            
-            if existing_stat:
-                # Update existing stats
-                self.cursor.execute(
-                    """
-                    UPDATE weekly_stats
-                    SET tasks_created = ?, tasks_completed = ?, tasks_canceled = ?, completion_rate = ?
-                    WHERE user_id = ? AND chat_id = ? AND week_number = ? AND year = ?
-                    """,
-                    (
-                        stat.tasks_created,
-                        stat.tasks_completed,
-                        stat.tasks_canceled,
-                        stat.completion_rate,
-                        stat.user_id,
-                        stat.chat_id,
-                        stat.week_number,
-                        stat.year
-                    )
-                )
-            else:
-                # Create new stats
-                self.cursor.execute(
-                    """
-                    INSERT INTO weekly_stats
-                    (user_id, chat_id, week_number, year, tasks_created, tasks_completed, tasks_canceled, completion_rate)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
+            self.cursor.executemany(
+                """
+                INSERT INTO weekly_stats
+                (user_id, chat_id, week_number, year, tasks_created, tasks_completed, tasks_canceled, completion_rate)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, chat_id, week_number, year) DO UPDATE
+                SET tasks_created = excluded.tasks_created,
+                    tasks_completed = excluded.tasks_completed,
+                    tasks_canceled = excluded.tasks_canceled,
+                    completion_rate = excluded.completion_rate
+                """,
+                [
                     (
                         stat.user_id,
                         stat.chat_id,
@@ -620,12 +843,63 @@ class DatabaseManager:
                         stat.tasks_canceled,
                         stat.completion_rate
                     )
-                )
-            
+                    for stat in stats
+                ]
+            )
             self.conn.commit()
             return True
         except sqlite3.Error as e:
-            logger.error(f"Error creating/updating weekly stats for user {stat.user_id} in chat {stat.chat_id}: {e}")
+            logger.error(f"Error saving weekly stats for {len(stats)} users: {e}")
+            return False
+        finally:
+            self._disconnect()
+    
+    def delete_weekly_stats(self, chat_id: int, week_number: int, year: int, user_ids: List[int]) -> bool:
+        """Delete weekly statistics of several users in a chat and week in a single transaction."""
+        try:
+            self._connect()
+            self.cursor.executemany(
+                "DELETE FROM weekly_stats WHERE user_id = ? AND chat_id = ? AND week_number = ? AND year = ?",
+                [(user_id, chat_id, week_number, year) for user_id in user_ids]
+            )
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error deleting weekly stats for {len(user_ids)} users in chat {chat_id}: {e}")
+            return False
+        finally:
+            self._disconnect()
+    
+    def archive_week(self, week_number: int, year: int) -> bool:
+        """Move weekly statistics of a finished week to the archive table in a single transaction.
+        
+        Archiving a week again replaces its archived rows instead of duplicating them.
+        """
+        try:
+            self._connect()
+            self.cursor.execute(
+                """
+                INSERT INTO weekly_stats_archive
+                (stat_id, user_id, chat_id, week_number, year, tasks_created, tasks_completed, tasks_canceled, completion_rate)
+                SELECT stat_id, user_id, chat_id, week_number, year, tasks_created, tasks_completed, tasks_canceled, completion_rate
+                FROM weekly_stats
+                WHERE week_number = ? AND year = ?
+                ON CONFLICT (user_id, chat_id, week_number, year) DO UPDATE
+                SET tasks_created = excluded.tasks_created,
+                    tasks_completed = excluded.tasks_completed,
+                    tasks_canceled = excluded.tasks_canceled,
+                    completion_rate = excluded.completion_rate
+                """,
+                (week_number, year)
+            )
+            self.cursor.execute(
+                "DELETE FROM weekly_stats WHERE week_number = ? AND year = ?",
+                (week_number, year)
+            )
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error archiving weekly stats for week {week_number} of {year}: {e}")
             return False
         finally:
             self._disconnect()
@@ -633,7 +907,7 @@ class DatabaseManager:
     def generate_weekly_stats_for_chat(self, chat_id: int, week_number: int, year: int) -> List[WeeklyStat]:
         """Generate weekly statistics for all users in a specific chat for a specific week."""
         try:
-            self._connect()
+            self._connect(read_only=True)
             
             # Get all active users in the chat
             self.cursor.execute(
@@ -645,85 +919,59 @@ class DatabaseManager:
                 (chat_id,)
             )
             user_ids = [row[0] for row in self.cursor.fetchall()]
-            
-            stats = []
-            for user_id in user_ids:
-                # Count tasks by status
-                self.cursor.execute(
-                    """
-                    SELECT COUNT(*) FROM tasks
-                    WHERE user_id = ? AND chat_id = ? AND week_number = ? AND year = ?
-                    """,
-                    (user_id, chat_id, week_number, year)
-                )
-                tasks_created = self.cursor.fetchone()[0]
-                
-                self.cursor.execute(
-                    """
-                    SELECT COUNT(*) FROM tasks
-                    WHERE user_id = ? AND chat_id = ? AND week_number = ? AND year = ? AND status = 'completed'
-                    """,
-                    (user_id, chat_id, week_number, year)
-                )
-                tasks_completed = self.cursor.fetchone()[0]
-                
-                self.cursor.execute(
-                    """
-                    SELECT COUNT(*) FROM tasks
-                    WHERE user_id = ? AND chat_id = ? AND week_number = ? AND year = ? AND status = 'canceled'
-                    """,
-                    (user_id, chat_id, week_number, year)
-                )
-                tasks_canceled = self.cursor.fetchone()[0]
-                
-                # Calculate completion rate
-                completion_rate = 0.0
-                if tasks_created > 0:
-                    completion_rate = tasks_completed / tasks_created
-                
-                # Create stats object
-                stat = WeeklyStat(
-                    user_id=user_id,
-                    chat_id=chat_id,
-                    week_number=week_number,
-                    year=year,
-                    tasks_created=tasks_created,
-                    tasks_completed=tasks_completed,
-                    tasks_canceled=tasks_canceled,
-                    completion_rate=completion_rate
-                )
-                
-                # Save to database
-                self.create_or_update_weekly_stat(stat)
-                stats.append(stat)
-            
-            return stats
         except sqlite3.Error as e:
             logger.error(f"Error generating weekly stats for chat {chat_id}: {e}")
             return []
         finally:
             self._disconnect()
+        
+        # Count tasks by status for all users at once
+        task_counts = self.count_chat_tasks_by_user(chat_id, week_number, year)
+        
+        stats = []
+        for user_id in user_ids:
+            tasks_created, tasks_completed, tasks_canceled, completion_rate = task_counts.get(user_id, (0, 0, 0, 0.0))
+            
+            # Create stats object
+            stats.append(WeeklyStat(
+                user_id=user_id,
+                chat_id=chat_id,
+                week_number=week_number,
+                year=year,
+                tasks_created=tasks_created,
+                tasks_completed=tasks_completed,
+                tasks_canceled=tasks_canceled,
+                completion_rate=completion_rate
+            ))
+        
+        # Save to database, skipping users without tasks; rows stored while
+        # they still had tasks are removed, so they don't keep stale counts
+        self.bulk_upsert_weekly_stats([stat for stat in stats if stat.tasks_created > 0])
+        idle_user_ids = [stat.user_id for stat in stats if stat.tasks_created == 0]
+        if idle_user_ids:
+            self.delete_weekly_stats(chat_id, week_number, year, idle_user_ids)
+        return stats
     
     def generate_weekly_stats_for_all_chats(self, week_number: int, year: int) -> Dict[int, List[WeeklyStat]]:
         """Generate weekly statistics for all users in all active chats for a specific week."""
         try:
-            self._connect()
+            self._connect(read_only=True)
             
             # Get all active chats
             self.cursor.execute("SELECT chat_id FROM chats WHERE is_active = 1")
             chat_ids = [row[0] for row in self.cursor.fetchall()]
-            
-            results = {}
-            for chat_id in chat_ids:
-                stats = self.generate_weekly_stats_for_chat(chat_id, week_number, year)
-                results[chat_id] = stats
-            
-            return results
         except sqlite3.Error as e:
             logger.error(f"Error generating weekly stats for all chats: {e}")
             return {}
         finally:
             self._disconnect()
+        
+        results = {}
+        for chat_id in chat_ids:
+            stats = self.generate_weekly_stats_for_chat(chat_id, week_number, year)
+            results[chat_id] = stats
+        
+        return results
     
     # Registration and initialization
     
@@ -762,32 +1010,32 @@ class DatabaseManager:
             
             self._disconnect()
             
-            # Create chat
+            # Create chat, or update its title if one is given; untitled chats
+            # default to "<first name>'s chat" of the registering user
             self._connect()
             self.cursor.execute(
-                "SELECT * FROM chats WHERE chat_id = ?",
-                (chat.chat_id,)
-            )
-            existing_chat = self.cursor.fetchone()
-            
-            if not existing_chat:
-                # Create chat
-                logger.info(f"Creating new chat {chat.chat_id}")
-                self.cursor.execute(
-                    """
-                    INSERT INTO chats (chat_id, title, chat_type, is_active, created_at)
-                    VALUES (?, ?, ?, ?, ?)
-                    """,
-                    (
-                        chat.chat_id,
-                        chat.title,
-                        chat.chat_type,
-                        1 if chat.is_active else 0,
-                        chat.created_at.isoformat() if chat.created_at else None
-                    )
+                """
+                INSERT INTO chats (chat_id, title, chat_type, is_active, created_at)
+                VALUES (
+                    :chat_id,
+                    COALESCE(:title, (SELECT first_name || '''s chat' FROM users WHERE user_id = :user_id)),
+                    :chat_type,
+                    :is_active,
+                    :created_at
                 )
-                self.conn.commit()
-            
+                ON CONFLICT(chat_id) DO UPDATE SET title = COALESCE(:title, chats.title)
+                """,
+                {
+                    'chat_id': chat.chat_id,
+                    'title': chat.title,
+                    'user_id': user.user_id,
+                    'chat_type': chat.chat_type,
+                    'is_active': 1 if chat.is_active else 0,
+                    'created_at': chat.created_at.isoformat() if chat.created_at else None
+                }
+            )
+            self.conn.commit()
+
             self._disconnect()
             
             # Create user-chat association
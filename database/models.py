@@ -1,10 +1,12 @@
 import sqlite3
 import datetime
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, List, Optional, Tuple, Any, Union
 
 class User:
     """User model representing a registered Telegram user."""
     
+    __slots__ = ('user_id', 'username', 'first_name', 'last_name', 'registration_date', 'is_active')
+    
     def __init__(
         self,
         user_id: int,
@@ -22,15 +24,15 @@ class User:
         self.is_active = is_active
     
     @classmethod
-    def from_row(cls, row: Tuple) -> 'User':
+    def from_row(cls, row: Union[Tuple, sqlite3.Row]) -> 'User':
         """Create a User instance from a database row."""
         return cls(
-            user_id=row[0],
-            username=row[1],
-            first_name=row[2],
-            last_name=row[3],
-            registration_date=datetime.datetime.fromisoformat(row[4]) if row[4] else None,
-            is_active=bool(row[5])
+            row[0],
+            row[1],
+            row[2],
+            row[3],
+            datetime.datetime.fromisoformat(row[4]) if row[4] else None,
+            bool(row[5])
         )
     
     def to_dict(self) -> Dict[str, Any]:
@@ -48,6 +50,8 @@ class User:
 class Chat:
     """Chat model representing a Telegram chat."""
     
+    __slots__ = ('chat_id', 'title', 'chat_type', 'is_active', 'created_at')
+    
     def __init__(
         self,
         chat_id: int,
@@ -63,14 +67,14 @@ class Chat:
         self.created_at = created_at or datetime.datetime.now()
     
     @classmethod
-    def from_row(cls, row: Tuple) -> 'Chat':
+    def from_row(cls, row: Union[Tuple, sqlite3.Row]) -> 'Chat':
         """Create a Chat instance from a database row."""
         return cls(
-            chat_id=row[0],
-            title=row[1],
-            chat_type=row[2],
-            is_active=bool(row[3]),
-            created_at=datetime.datetime.fromisoformat(row[4]) if row[4] else None
+            row[0],
+            row[1],
+            row[2],
+            bool(row[3]),
+            datetime.datetime.fromisoformat(row[4]) if row[4] else None
         )
     
     def to_dict(self) -> Dict[str, Any]:
@@ -87,6 +91,8 @@ class Chat:
 class UserChat:
     """Association between a User and a Chat."""
     
+    __slots__ = ('user_id', 'chat_id', 'joined_at', 'is_active')
+    
     def __init__(
         self,
         user_id: int,
@@ -100,13 +106,13 @@ class UserChat:
         self.is_active = is_active
     
     @classmethod
-    def from_row(cls, row: Tuple) -> 'UserChat':
+    def from_row(cls, row: Union[Tuple, sqlite3.Row]) -> 'UserChat':
         """Create a UserChat instance from a database row."""
         return cls(
-            user_id=row[0],
-            chat_id=row[1],
-            joined_at=datetime.datetime.fromisoformat(row[2]) if row[2] else None,
-            is_active=bool(row[3])
+            row[0],
+            row[1],
+            datetime.datetime.fromisoformat(row[2]) if row[2] else None,
+            bool(row[3])
         )
     
     def to_dict(self) -> Dict[str, Any]:
@@ -122,6 +128,11 @@ class UserChat:
 class Task:
     """Task model representing a user's task in a specific chat."""
     
+    __slots__ = (
+        'task_id', 'user_id', 'chat_id', 'description', 'status',
+        'created_at', 'updated_at', 'week_number', 'year'
+    )
+    
     def __init__(
         self,
         task_id: Optional[int] = None,
@@ -152,18 +163,18 @@ class Task:
             self.year = year
     
     @classmethod
-    def from_row(cls, row: Tuple) -> 'Task':
+    def from_row(cls, row: Union[Tuple, sqlite3.Row]) -> 'Task':
         """Create a Task instance from a database row."""
         return cls(
-            task_id=row[0],
-            user_id=row[1],
-            chat_id=row[2],
-            description=row[3],
-            status=row[4],
-            created_at=datetime.datetime.fromisoformat(row[5]) if row[5] else None,
-            updated_at=datetime.datetime.fromisoformat(row[6]) if row[6] else None,
-            week_number=row[7],
-            year=row[8]
+            row[0],
+            row[1],
+            row[2],
+            row[3],
+            row[4],
+            datetime.datetime.fromisoformat(row[5]) if row[5] else None,
+            datetime.datetime.fromisoformat(row[6]) if row[6] else None,
+            row[7],
+            row[8]
         )
     
     def to_dict(self) -> Dict[str, Any]:
@@ -184,6 +195,11 @@ class Task:
 class WeeklyStat:
     """Weekly statistics model for a user in a specific chat."""
     
+    __slots__ = (
+        'stat_id', 'user_id', 'chat_id', 'week_number', 'year',
+        'tasks_created', 'tasks_completed', 'tasks_canceled', 'completion_rate'
+    )
+    
     def __init__(
         self,
         stat_id: Optional[int] = None,
@@ -207,18 +223,18 @@ class WeeklyStat:
         self.completion_rate = completion_rate
     
     @classmethod
-    def from_row(cls, row: Tuple) -> 'WeeklyStat':
+    def from_row(cls, row: Union[Tuple, sqlite3.Row]) -> 'WeeklyStat':
         """Create a WeeklyStat instance from a database row."""
         return cls(
-            stat_id=row[0],
-            user_id=row[1],
-            chat_id=row[2],
-            week_number=row[3],
-            year=row[4],
-            tasks_created=row[5],
-            tasks_completed=row[6],
-            tasks_canceled=row[7],
-            completion_rate=row[8]
+            row[0],
+            row[1],
+            row[2],
+            row[3],
+            row[4],
+            row[5],
+            row[6],
+            row[7],
+            row[8]
         )
     
     def to_dict(self) -> Dict[str, Any]:
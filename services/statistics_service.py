@@ -5,13 +5,31 @@ This module handles generation and storage of weekly statistics.
 
 import logging
 import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, Any, List, Optional, Tuple
 
+from cachetools import TTLCache
+
 from database import DatabaseManager, WeeklyStat, User
 import config
 
 logger = logging.getLogger(__name__)
 
+# Task counts (created, completed, canceled, completion_rate) for a user without tasks
+_NO_TASKS = (0, 0, 0, 0.0)
+
+# Marks a cache miss, since None is a valid cached result
+_MISSING = object()
+
+_WEEKLY_STATS_TEMPLATE = (
+    "📊 Weekly Statistics (Week {week_number}, {year}):\n\n"
+    "Total tasks: {tasks_created}\n"
+    "Completed tasks: {tasks_completed}\n"
+    "Canceled tasks: {tasks_canceled}\n"
+    "Completion rate: {completion_rate:.1f}%\n"
+)
+
 class StatisticsService:
     """Service for statistics-related operations."""
     
@@ -22,100 +40,176 @@ class StatisticsService:
             db_manager: Database manager instance.
         """
         self.db_manager = db_manager
+        
+        # Recent statistics reads, dropped when the statistics are regenerated
+        self._stats_cache = TTLCache(maxsize=config.STATS_CACHE_SIZE, ttl=config.STATS_CACHE_TTL)
+        self._history_cache = TTLCache(maxsize=config.STATS_CACHE_SIZE, ttl=config.STATS_CACHE_TTL)
+        self._cache_lock = threading.Lock()
+    
+    def _invalidate_cached_stats(self, stats: List[WeeklyStat]):
+        """Drop cached reads of the given statistics.
+        
+        Args:
+            stats: WeeklyStat objects that were just saved or deleted.
+        """
+        user_chats = {(stat.user_id, stat.chat_id) for stat in stats}
+        with self._cache_lock:
+            for stat in stats:
+                self._stats_cache.pop((stat.user_id, stat.chat_id, stat.week_number, stat.year), None)
+            for key in [key for key in self._history_cache if key[:2] in user_chats]:
+                self._history_cache.pop(key, None)
     
-    def generate_weekly_stats_for_chat(self, chat_id: int) -> List[WeeklyStat]:
+    def generate_weekly_stats_for_chat(self, chat_id: int, week_number: Optional[int] = None,
+                                       year: Optional[int] = None) -> List[WeeklyStat]:
         """Generate weekly statistics for all users in a specific chat.
         
         Args:
             chat_id: Telegram chat ID.
+            week_number: Optional week number, defaults to the current week.
+            year: Optional year, defaults to the current year.
             
         Returns:
             List of WeeklyStat objects.
         """
+        stats, _ = self._generate_weekly_stats_for_chat(chat_id, week_number, year)
+        return stats
+    
+    def _generate_weekly_stats_for_chat(self, chat_id: int, week_number: Optional[int],
+                                        year: Optional[int]) -> Tuple[List[WeeklyStat], bool]:
+        """Generate weekly statistics for a chat, reporting whether it failed.
+        
+        Args:
+            chat_id: Telegram chat ID.
+            week_number: Week number, or None for the current week.
+            year: Year, or None for the current year.
+            
+        Returns:
+            List of WeeklyStat objects, and whether they were generated and
+            saved without errors.
+        """
         try:
-            # Get current week and year
-            now = datetime.datetime.now()
-            week_number = now.isocalendar()[1]
-            year = now.year
+            # If week_number and year are not provided, use current week
+            if week_number is None or year is None:
+                now = datetime.datetime.now()
+                week_number = now.isocalendar()[1]
+                year = now.year
             
             # Get all users in the chat
             users = self.db_manager.get_chat_users(chat_id)
             logger.info(f"Found {len(users)} users in chat {chat_id}")
             
+            # Count tasks by status for all users in a single query
+            task_counts = self.db_manager.count_chat_tasks_by_user(chat_id, week_number, year)
+            
+            # Build statistics for every user; no I/O happens here
             stats = []
             for user in users:
+                total_tasks, completed_tasks, canceled_tasks, completion_rate = task_counts.get(
+                    user.user_id, _NO_TASKS)
+                stats.append(WeeklyStat(
+                    user_id=user.user_id,
+                    chat_id=chat_id,
+                    week_number=week_number,
+                    year=year,
+                    tasks_created=total_tasks,
+                    tasks_completed=completed_tasks,
+                    tasks_canceled=canceled_tasks,
+                    completion_rate=completion_rate
+                ))
+            
+            # Only users who created tasks get a stored row; the others are
+            # still returned with zero counts
+            active_stats = [stat for stat in stats if stat.tasks_created > 0]
+            idle_stats = [stat for stat in stats if stat.tasks_created == 0]
+            
+            # Try to save to database; failures are reported, not raised
+            saved = True
+            if active_stats:
                 try:
-                    # Get user's tasks for the current week
-                    tasks = self.db_manager.get_user_tasks_in_chat(user.user_id, chat_id, week_number, year)
-                    logger.info(f"Found {len(tasks)} tasks for user {user.user_id} in chat {chat_id}")
-                    
-                    # Count tasks by status
-                    total_tasks = len(tasks)
-                    completed_tasks = sum(1 for task in tasks if task.status == 'completed')
-                    canceled_tasks = sum(1 for task in tasks if task.status == 'canceled')
-                    
-                    # Calculate completion rate
-                    completion_rate = 0.0
-                    if total_tasks > 0:
-                        completion_rate = completed_tasks / total_tasks
-                    
-                    # Create or update weekly stat
-                    stat = WeeklyStat(
-                        user_id=user.user_id,
-                        chat_id=chat_id,
-                        week_number=week_number,
-                        year=year,
-                        tasks_created=total_tasks,
-                        tasks_completed=completed_tasks,
-                        tasks_canceled=canceled_tasks,
-                        completion_rate=completion_rate
-                    )
-                    
-                    # Try to save to database, but don't fail if it doesn't work
-                    try:
-                        success = self.db_manager.create_or_update_weekly_stat(stat)
-                        if success:
-                            logger.info(f"Updated statistics for user {user.user_id} in chat {chat_id}")
-                        else:
-                            logger.error(f"Failed to update statistics for user {user.user_id} in chat {chat_id}")
-                    except Exception as e:
-                        logger.error(f"Error saving statistics for user {user.user_id} in chat {chat_id}: {e}")
-                    
-                    # Add to stats list regardless of whether it was saved to the database
-                    stats.append(stat)
+                    success = self.db_manager.bulk_upsert_weekly_stats(active_stats)
+                    self._invalidate_cached_stats(active_stats)
+                    if success:
+                        logger.info(f"Updated statistics for {len(active_stats)} users in chat {chat_id}")
+                    else:
+                        logger.error(f"Failed to update statistics in chat {chat_id}")
+                        saved = False
                 except Exception as e:
-                    logger.error(f"Error processing user {user.user_id} in chat {chat_id}: {e}")
-                    continue
+                    logger.error(f"Error saving statistics in chat {chat_id}: {e}")
+                    saved = False
+            
+            # Drop rows stored while idle users still had tasks, e.g. before
+            # their tasks were deleted, so they don't keep stale counts
+            if idle_stats:
+                try:
+                    success = self.db_manager.delete_weekly_stats(
+                        chat_id, week_number, year, [stat.user_id for stat in idle_stats])
+                    self._invalidate_cached_stats(idle_stats)
+                    if not success:
+                        logger.error(f"Failed to clear statistics of idle users in chat {chat_id}")
+                        saved = False
+                except Exception as e:
+                    logger.error(f"Error clearing statistics of idle users in chat {chat_id}: {e}")
+                    saved = False
             
             logger.info(f"Generated weekly statistics for chat {chat_id}")
-            return stats
+            return stats, saved
         except Exception as e:
             logger.error(f"Error generating weekly statistics for chat {chat_id}: {e}")
             import traceback
             logger.error(traceback.format_exc())
-            return []
+            return [], False
     
-    def generate_weekly_stats_for_all_chats(self) -> Dict[int, List[WeeklyStat]]:
+    def generate_weekly_stats_for_all_chats(self, week_number: Optional[int] = None,
+                                            year: Optional[int] = None) -> Dict[int, List[WeeklyStat]]:
         """Generate weekly statistics for all users in all active chats.
         
+        Args:
+            week_number: Optional week number, defaults to the current week.
+            year: Optional year, defaults to the current year.
+            
         Returns:
             Dictionary mapping chat IDs to lists of WeeklyStat objects.
         """
         try:
-            # Get all active chats
-            chats = self.db_manager.get_all_active_chats()
-            
-            results = {}
-            for chat in chats:
-                stats = self.generate_weekly_stats_for_chat(chat.chat_id)
-                results[chat.chat_id] = stats
-            
+            results, _ = self._generate_weekly_stats_for_all_chats(week_number, year)
             logger.info("Generated weekly statistics for all chats")
             return results
         except Exception as e:
             logger.error(f"Error generating weekly statistics for all chats: {e}")
             return {}
     
+    def _generate_weekly_stats_for_all_chats(self, week_number: Optional[int],
+                                             year: Optional[int]) -> Tuple[Dict[int, List[WeeklyStat]], List[int]]:
+        """Generate weekly statistics for all active chats, reporting the chats that failed.
+        
+        Args:
+            week_number: Week number, or None for the current week.
+            year: Year, or None for the current year.
+            
+        Returns:
+            Dictionary mapping chat IDs to lists of WeeklyStat objects, and the
+            IDs of chats whose statistics could not be generated or saved.
+        """
+        # Get all active chats
+        chats = self.db_manager.get_all_active_chats()
+        
+        # Chats are independent and the work is bound by DB round-trips,
+        # so process them concurrently
+        results = {}
+        failed_chat_ids = []
+        with ThreadPoolExecutor(max_workers=config.STATS_MAX_WORKERS) as executor:
+            futures = {
+                executor.submit(self._generate_weekly_stats_for_chat, chat.chat_id, week_number, year): chat.chat_id
+                for chat in chats
+            }
+            for future in as_completed(futures):
+                chat_id = futures[future]
+                results[chat_id], saved = future.result()
+                if not saved:
+                    failed_chat_ids.append(chat_id)
+        
+        return results, failed_chat_ids
+    
     def get_weekly_stats(self, user_id: int, chat_id: int, week_number: Optional[int] = None, 
                         year: Optional[int] = None) -> Optional[WeeklyStat]:
         """Get weekly statistics for a user in a specific chat.
@@ -136,8 +230,15 @@ class StatisticsService:
                 week_number = now.isocalendar()[1]
                 year = now.year
             
-            # Get statistics
-            stat = self.db_manager.get_weekly_stat(user_id, chat_id, week_number, year)
+            key = (user_id, chat_id, week_number, year)
+            with self._cache_lock:
+                stat = self._stats_cache.get(key, _MISSING)
+            
+            if stat is _MISSING:
+                # Get statistics
+                stat = self.db_manager.get_weekly_stat(user_id, chat_id, week_number, year)
+                with self._cache_lock:
+                    self._stats_cache[key] = stat
             
             return stat
         except Exception as e:
@@ -156,8 +257,15 @@ class StatisticsService:
             List of WeeklyStat objects.
         """
         try:
-            # Get statistics history
-            stats = self.db_manager.get_user_stats_history_in_chat(user_id, chat_id, limit)
+            key = (user_id, chat_id, limit)
+            with self._cache_lock:
+                stats = self._history_cache.get(key, _MISSING)
+            
+            if stats is _MISSING:
+                # Get statistics history
+                stats = self.db_manager.get_user_stats_history_in_chat(user_id, chat_id, limit)
+                with self._cache_lock:
+                    self._history_cache[key] = stats
             
             return stats
         except Exception as e:
@@ -187,29 +295,21 @@ class StatisticsService:
             users = self.db_manager.get_chat_users(chat_id)
             
             # Get completion rates for each user
+            task_counts = None
             result = []
             for user in users:
                 try:
                     # Try to get user's weekly stats from database
                     stat = self.db_manager.get_weekly_stat(user.user_id, chat_id, week_number, year)
                     
-                    # If no stats found, calculate them from tasks
-                    if not stat:
-                        tasks = self.db_manager.get_user_tasks_in_chat(user.user_id, chat_id, week_number, year)
-                        
-                        # Count tasks by status
-                        total_tasks = len(tasks)
-                        completed_tasks = sum(1 for task in tasks if task.status == 'completed')
-                        
-                        # Calculate completion rate
-                        completion_rate = 0.0
-                        if total_tasks > 0:
-                            completion_rate = completed_tasks / total_tasks
-                    else:
+                    if stat:
                         # Use stats from database
-                        completion_rate = 0.0
-                        if stat.tasks_created > 0:
-                            completion_rate = stat.tasks_completed / stat.tasks_created
+                        completion_rate = stat.completion_rate
+                    else:
+                        # If no stats found, take them from the task counts of the whole chat
+                        if task_counts is None:
+                            task_counts = self.db_manager.count_chat_tasks_by_user(chat_id, week_number, year)
+                        completion_rate = task_counts.get(user.user_id, _NO_TASKS)[3]
                     
                     # Add to result
                     username = user.username or f"{user.first_name} {user.last_name or ''}"
@@ -238,13 +338,14 @@ class StatisticsService:
             return "No statistics available."
         
         # Format statistics
-        stats_text = f"📊 Weekly Statistics (Week {stat.week_number}, {stat.year}):\n\n"
-        stats_text += f"Total tasks: {stat.tasks_created}\n"
-        stats_text += f"Completed tasks: {stat.tasks_completed}\n"
-        stats_text += f"Canceled tasks: {stat.tasks_canceled}\n"
-        stats_text += f"Completion rate: {stat.completion_rate * 100:.1f}%\n"
-        
-        return stats_text
+        return _WEEKLY_STATS_TEMPLATE.format(
+            week_number=stat.week_number,
+            year=stat.year,
+            tasks_created=stat.tasks_created,
+            tasks_completed=stat.tasks_completed,
+            tasks_canceled=stat.tasks_canceled,
+            completion_rate=stat.completion_rate * 100
+        )
     
     def format_chat_completion_rates(self, chat_id: int, week_number: Optional[int] = None,
                                     year: Optional[int] = None) -> str:
@@ -268,16 +369,10 @@ class StatisticsService:
             # Get completion rates
             completion_rates = self.get_chat_users_completion_rates(chat_id, week_number, year)
             
+            # Rates are already computed from tasks for users without saved stats,
+            # so an empty result means there is nobody to report on
             if not completion_rates:
-                # Try to generate statistics on the fly
-                logger.info(f"No statistics found for chat {chat_id}, generating on the fly")
-                self.generate_weekly_stats_for_chat(chat_id)
-                
-                # Try again to get completion rates
-                completion_rates = self.get_chat_users_completion_rates(chat_id, week_number, year)
-                
-                if not completion_rates:
-                    return "No statistics available for this chat."
+                return "No statistics available for this chat."
             
             # Format completion rates
             stats_text = f"📊 Chat Completion Rates (Week {week_number}, {year}):\n\n"
@@ -326,10 +421,32 @@ class StatisticsService:
             True if the reset was successful, False otherwise.
         """
         try:
+            # The reset runs at the start of Monday, so a day earlier is always
+            # inside the week that has just finished
+            finished = datetime.datetime.now() - datetime.timedelta(days=1)
+            week_number = finished.isocalendar()[1]
+            year = finished.year
+            
             # First, generate statistics for all chats to ensure we have a record
-            self.generate_weekly_stats_for_all_chats()
+            _, failed_chat_ids = self._generate_weekly_stats_for_all_chats(week_number, year)
+            if failed_chat_ids:
+                logger.error(f"Failed to generate statistics for week {week_number} of {year} "
+                             f"in chats {failed_chat_ids}")
+            
+            # Then move the finished week to the archive. This also covers chats
+            # deactivated during the week, and archiving is idempotent, so a rerun
+            # after a failure replaces the rows archived now.
+            if not self.db_manager.archive_week(week_number, year):
+                logger.error(f"Failed to archive statistics for week {week_number} of {year}")
+                return False
+            
+            # Archived rows are no longer returned by weekly statistics reads
+            with self._cache_lock:
+                self._stats_cache.clear()
+                self._history_cache.clear()
             
-            # TODO: Implement task archiving if needed
+            if failed_chat_ids:
+                return False
             
             logger.info("Weekly tasks reset completed")
             return True
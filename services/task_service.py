@@ -1,5 +1,6 @@
 import logging
 import datetime
+from collections import Counter
 from typing import Optional, List, Dict, Any
 
 from database import DatabaseManager, Task
@@ -7,6 +8,10 @@ import config
 
 logger = logging.getLogger(__name__)
 
+_STATUS_CREATED = config.TASK_STATUS['CREATED']
+_STATUS_COMPLETED = config.TASK_STATUS['COMPLETED']
+_STATUS_CANCELED = config.TASK_STATUS['CANCELED']
+
 class TaskService:
     """Service for task-related operations."""
     
@@ -237,11 +242,12 @@ class TaskService:
             # Get tasks for current week
             tasks = self.db_manager.get_user_tasks_in_chat(user_id, chat_id, week_number, year)
             
-            # Count tasks by status
+            # Count tasks by status in a single pass
             total_tasks = len(tasks)
-            completed_tasks = sum(1 for task in tasks if task.status == config.TASK_STATUS['COMPLETED'])
-            canceled_tasks = sum(1 for task in tasks if task.status == config.TASK_STATUS['CANCELED'])
-            created_tasks = sum(1 for task in tasks if task.status == config.TASK_STATUS['CREATED'])
+            status_counts = Counter(task.status for task in tasks)
+            completed_tasks = status_counts[_STATUS_COMPLETED]
+            canceled_tasks = status_counts[_STATUS_CANCELED]
+            created_tasks = status_counts[_STATUS_CREATED]
             
             # Calculate completion rate
             completion_rate = 0.0
@@ -1,13 +1,42 @@
+import asyncio
 import logging
-from typing import Optional, List, Dict, Any
+import datetime
+import time
+from functools import lru_cache
+from typing import Optional, List, Dict, Any, Tuple
+
+from cachetools import TTLCache
 
 from database import DatabaseManager, User, Chat, UserChat
 from database.models import User, Chat, UserChat
+import config
 
 logger = logging.getLogger(__name__)
 
+# Counters reported for a week without statistics
+_EMPTY_STATS = {
+    'tasks_created': 0,
+    'tasks_completed': 0,
+    'tasks_canceled': 0,
+    'completion_rate': 0.0
+}
+
+@lru_cache(maxsize=2)
+def _current_iso_week(bucket: int) -> Tuple[int, int]:
+    """Get the current (week_number, year), computed once per time bucket.
+    
+    Args:
+        bucket: Current time in whole seconds, used as the cache key.
+    """
+    now = datetime.datetime.now()
+    return now.isocalendar()[1], now.year
+
 class UserService:
-    """Service for user-related operations."""
+    """Service for user-related operations.
+    
+    Methods are coroutines; blocking database calls run in a worker thread
+    so they do not stall the bot's event loop.
+    """
     
     def __init__(self, db_manager: DatabaseManager):
         """Initialize the user service.
@@ -16,8 +45,23 @@ class UserService:
             db_manager: Database manager instance.
         """
         self.db_manager = db_manager
+        
+        # Per-process caches for hot lookups, invalidated on writes
+        self._user_cache = TTLCache(maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL)
+        self._user_chats_cache = TTLCache(maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL)
+        self._user_chat_cache = TTLCache(maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL)
+        
+        # Failed registration checks are cached briefly, so unknown users don't hit the database
+        self._unregistered_cache = TTLCache(maxsize=config.USER_CACHE_SIZE, ttl=config.USER_NEGATIVE_CACHE_TTL)
     
-    def register_user(self, user_id: int, username: Optional[str], first_name: Optional[str], 
+    def cache_clear(self):
+        """Clear all cached user lookups."""
+        self._user_cache.clear()
+        self._user_chats_cache.clear()
+        self._user_chat_cache.clear()
+        self._unregistered_cache.clear()
+    
+    async def register_user(self, user_id: int, username: Optional[str], first_name: Optional[str], 
                      last_name: Optional[str], chat_id: int, chat_title: Optional[str], 
                      chat_type: str) -> bool:
         """Register a user in a chat.
@@ -45,24 +89,28 @@ class UserService:
             
             chat = Chat(
                 chat_id=chat_id,
-                title=chat_title if chat_title else f"{first_name}'s chat",
+                title=chat_title or None,  # Defaulted by the database
                 chat_type=chat_type
             )
             
             # Register user in chat
-            success = self.db_manager.register_user_in_chat(user, chat)
+            success = await asyncio.to_thread(self.db_manager.register_user_in_chat, user, chat)
             
             if success:
-                logger.info(f"User {user_id} registered in chat {chat_id}")
+                self._user_cache.pop(user_id, None)
+                self._user_chats_cache.pop(user_id, None)
+                self._user_chat_cache.pop((user_id, chat_id), None)
+                self._unregistered_cache.pop((user_id, chat_id), None)
+                logger.info("User %s registered in chat %s", user_id, chat_id)
             else:
-                logger.error(f"Failed to register user {user_id} in chat {chat_id}")
+                logger.error("Failed to register user %s in chat %s", user_id, chat_id)
             
             return success
-        except Exception as e:
-            logger.error(f"Error registering user {user_id} in chat {chat_id}: {e}")
+        except Exception:
+            logger.error("Error registering user %s in chat %s", user_id, chat_id, exc_info=True)
             return False
     
-    def get_user(self, user_id: int) -> Optional[User]:
+    async def get_user(self, user_id: int) -> Optional[User]:
         """Get a user by ID.
         
         Args:
@@ -71,9 +119,14 @@ class UserService:
         Returns:
             User object if found, None otherwise.
         """
-        return self.db_manager.get_user(user_id)
+        user = self._user_cache.get(user_id)
+        if user is None:
+            user = await asyncio.to_thread(self.db_manager.get_user, user_id)
+            if user is not None:
+                self._user_cache[user_id] = user
+        return user
     
-    def get_user_chats(self, user_id: int) -> List[Chat]:
+    async def get_user_chats(self, user_id: int) -> List[Chat]:
         """Get all chats for a user.
         
         Args:
@@ -82,9 +135,13 @@ class UserService:
         Returns:
             List of Chat objects.
         """
-        return self.db_manager.get_user_chats(user_id)
+        chats = self._user_chats_cache.get(user_id)
+        if chats is None:
+            chats = await asyncio.to_thread(self.db_manager.get_user_chats, user_id)
+            self._user_chats_cache[user_id] = chats
+        return chats
     
-    def is_user_registered(self, user_id: int, chat_id: int) -> bool:
+    async def is_user_registered(self, user_id: int, chat_id: int) -> bool:
         """Check if a user is registered in a chat.
         
         Args:
@@ -94,10 +151,21 @@ class UserService:
         Returns:
             True if the user is registered in the chat, False otherwise.
         """
-        user_chat = self.db_manager.get_user_chat(user_id, chat_id)
-        return user_chat is not None and user_chat.is_active
+        key = (user_id, chat_id)
+        if key in self._user_chat_cache:
+            return True
+        if key in self._unregistered_cache:
+            return False
+        
+        user_chat = await asyncio.to_thread(self.db_manager.get_user_chat, user_id, chat_id)
+        registered = user_chat is not None and user_chat.is_active
+        if registered:
+            self._user_chat_cache[key] = True
+        else:
+            self._unregistered_cache[key] = True
+        return registered
     
-    def update_user_profile(self, user_id: int, username: Optional[str] = None, 
+    async def update_user_profile(self, user_id: int, username: Optional[str] = None, 
                            first_name: Optional[str] = None, last_name: Optional[str] = None) -> bool:
         """Update a user's profile.
         
@@ -112,12 +180,13 @@ class UserService:
         """
         try:
             # Get existing user
-            user = self.db_manager.get_user(user_id)
+            user = await asyncio.to_thread(self.db_manager.get_user, user_id)
             if not user:
-                logger.error(f"User {user_id} not found")
+                logger.error("User %s not found", user_id)
                 return False
             
             # Update user fields if provided
+            before = (user.username, user.first_name, user.last_name)
             if username is not None:
                 user.username = username
             if first_name is not None:
@@ -125,20 +194,25 @@ class UserService:
             if last_name is not None:
                 user.last_name = last_name
             
+            # Nothing changed, skip the write
+            if (user.username, user.first_name, user.last_name) == before:
+                return True
+            
             # Save updated user
-            success = self.db_manager.update_user(user)
+            success = await asyncio.to_thread(self.db_manager.update_user, user)
             
             if success:
-                logger.info(f"User {user_id} profile updated")
+                self._user_cache.pop(user_id, None)
+                logger.info("User %s profile updated", user_id)
             else:
-                logger.error(f"Failed to update user {user_id} profile")
+                logger.error("Failed to update user %s profile", user_id)
             
             return success
-        except Exception as e:
-            logger.error(f"Error updating user {user_id} profile: {e}")
+        except Exception:
+            logger.error("Error updating user %s profile", user_id, exc_info=True)
             return False
     
-    def get_user_stats(self, user_id: int, chat_id: int) -> Dict[str, Any]:
+    async def get_user_stats(self, user_id: int, chat_id: int) -> Dict[str, Any]:
         """Get statistics for a user in a chat.
         
         Args:
@@ -149,36 +223,36 @@ class UserService:
             Dictionary with user statistics.
         """
         try:
-            # Get user and chat
-            user = self.db_manager.get_user(user_id)
-            chat = self.db_manager.get_chat(chat_id)
+            # Get current week stats
+            week_number, year = _current_iso_week(int(time.time()))
             
-            if not user or not chat:
-                logger.error(f"User {user_id} or chat {chat_id} not found")
-                return {}
+            # Get user, chat and weekly stats in a single query
+            row = await asyncio.to_thread(
+                self.db_manager.get_user_stats_bundle, user_id, chat_id, week_number, year
+            )
             
-            # Get current week stats
-            import datetime
-            now = datetime.datetime.now()
-            week_number = now.isocalendar()[1]
-            year = now.year
+            if not row:
+                logger.error("User %s or chat %s not found", user_id, chat_id)
+                return {}
             
-            weekly_stat = self.db_manager.get_weekly_stat(user_id, chat_id, week_number, year)
+            stat_id, tasks_created, tasks_completed, tasks_canceled = row[2:]
             
-            if not weekly_stat:
+            if stat_id is None:
                 # No stats for current week, return empty stats
-                return {
-                    'user_id': user_id,
-                    'chat_id': chat_id,
-                    'week_number': week_number,
-                    'year': year,
-                    'tasks_created': 0,
-                    'tasks_completed': 0,
-                    'tasks_canceled': 0,
-                    'completion_rate': 0.0
-                }
-            
-            return weekly_stat.to_dict()
-        except Exception as e:
-            logger.error(f"Error getting stats for user {user_id} in chat {chat_id}: {e}")
+                return {**_EMPTY_STATS, 'user_id': user_id, 'chat_id': chat_id,
+                        'week_number': week_number, 'year': year}
+            
+            return {
+                'stat_id': stat_id,
+                'user_id': user_id,
+                'chat_id': chat_id,
+                'week_number': week_number,
+                'year': year,
+                'tasks_created': tasks_created,
+                'tasks_completed': tasks_completed,
+                'tasks_canceled': tasks_canceled,
+                'completion_rate': tasks_completed / tasks_created if tasks_created else 0.0
+            }
+        except Exception:
+            logger.error("Error getting stats for user %s in chat %s", user_id, chat_id, exc_info=True)
             return {}
\ No newline at end of file
@@ -6,10 +6,15 @@ Simple Test Bot
 A minimal bot to test the python-telegram-bot library.
 """
 
+import os
 import logging
+from dotenv import load_dotenv
 from telegram.ext import Application, CommandHandler, ContextTypes
 from telegram import Update
 
+# Load environment variables from .env file
+load_dotenv()
+
 # Enable logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -28,15 +33,25 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
 def main() -> None:
     """Start the bot."""
-    # Create the Application
-    application = Application.builder().token("7522167173:AAFpBoJsOmA0oY3EIKsIh2X24GWqqS03zTk").build()
+    token = os.getenv('TELEGRAM_API_TOKEN')
+    if not token:
+        logger.error("No TELEGRAM_API_TOKEN found in environment, not starting the bot")
+        return
+
+    # Create the Application, handling updates concurrently
+    application = Application.builder().token(token).concurrent_updates(True).build()
 
     # Add handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
 
-    # Start the Bot
-    application.run_polling()
+    # Start the Bot, long-polling for message updates only
+    application.run_polling(
+        poll_interval=0.0,
+        timeout=30,
+        allowed_updates=[Update.MESSAGE],
+        drop_pending_updates=True
+    )
     logger.info("Bot started")
 
 if __name__ == '__main__':
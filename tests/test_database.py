@@ -6,41 +6,59 @@ Test script for Telegram Task Bot database manager.
 This script tests the database operations directly.
 """
 
-import sys
 import os
 import unittest
 import datetime
 import sqlite3
 import tempfile
-
-# Add parent directory to path to import modules
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from concurrent.futures import ThreadPoolExecutor
 
 from database import DatabaseManager, User, Chat, UserChat, Task, WeeklyStat
 
+# Fixed timestamp for test data, so tests don't depend on the clock
+FROZEN_NOW = datetime.datetime(2025, 1, 6, 12, 0, 0)
+
+# Tables wiped between tests, children before parents
+TABLES = ('weekly_stats_archive', 'weekly_stats', 'tasks', 'user_chats', 'chats', 'users')
+
 class TestDatabaseManager(unittest.TestCase):
     """Test cases for DatabaseManager."""
     
-    def setUp(self):
-        """Set up test environment with a temporary database."""
-        # Create a temporary file for the database
-        self.db_fd, self.db_path = tempfile.mkstemp()
-        
-        # Initialize database manager with the temporary database
-        self.db_manager = DatabaseManager(db_path=self.db_path)
-        
-        # Tables are created automatically in _init_db() during initialization
-        # No need to call create_tables()
+    @classmethod
+    def setUpClass(cls):
+        """Set up a shared in-memory database, so the schema is created once."""
+        cls.db_manager = DatabaseManager(db_path=':memory:')
+    
+    @classmethod
+    def tearDownClass(cls):
+        """Close the shared database."""
+        cls.db_manager.close()
     
     def tearDown(self):
-        """Clean up after tests."""
-        # Close the database connection if it exists
-        if hasattr(self.db_manager, 'conn') and self.db_manager.conn:
-            self.db_manager.conn.close()
-        
-        # Remove the temporary database file
-        os.close(self.db_fd)
-        os.unlink(self.db_path)
+        """Clear all tables so every test starts from an empty database."""
+        conn = self.db_manager.conn
+        for table in TABLES:
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute("DELETE FROM sqlite_sequence")
+        conn.commit()
+    
+    def _seed_user_chat(self):
+        """Insert user 123, chat 456 and their association in one transaction."""
+        now = FROZEN_NOW.isoformat()
+        conn = self.db_manager.conn
+        with conn:
+            conn.executemany(
+                "INSERT INTO users VALUES (?, ?, ?, ?, ?, ?)",
+                [(123, "testuser", "Test", "User", now, 1)]
+            )
+            conn.executemany(
+                "INSERT INTO chats VALUES (?, ?, ?, ?, ?)",
+                [(456, "Test Chat", "group", 1, now)]
+            )
+            conn.executemany(
+                "INSERT INTO user_chats VALUES (?, ?, ?, ?)",
+                [(123, 456, now, 1)]
+            )
     
     def test_create_and_get_user(self):
         """Test creating and retrieving a user."""
@@ -133,20 +151,32 @@ class TestDatabaseManager(unittest.TestCase):
         self.assertEqual(retrieved_user_chat.user_id, 123)
         self.assertEqual(retrieved_user_chat.chat_id, 456)
         self.assertTrue(retrieved_user_chat.is_active)
+        
+        # The chat is listed among the user's chats
+        chats = self.db_manager.get_user_chats(123)
+        self.assertEqual([c.chat_id for c in chats], [456])
+        self.assertEqual(chats[0].title, "Test Chat")
+    
+    def test_register_user_in_chat_chat_title(self):
+        """Test that registration defaults a missing chat title and keeps an existing one."""
+        user = User(user_id=123, username="testuser", first_name="Test", last_name="User")
+        
+        self.assertTrue(self.db_manager.register_user_in_chat(user, Chat(chat_id=456, chat_type="private")))
+        self.assertEqual(self.db_manager.get_chat(456).title, "Test's chat")
+        
+        # A new title replaces the stored one, a missing title leaves it alone
+        self.assertTrue(self.db_manager.register_user_in_chat(user, Chat(chat_id=456, title="Renamed")))
+        self.assertTrue(self.db_manager.register_user_in_chat(user, Chat(chat_id=456)))
+        self.assertEqual(self.db_manager.get_chat(456).title, "Renamed")
+        self.assertTrue(self.db_manager.get_user_chat(123, 456).is_active)
     
     def test_create_and_get_task(self):
         """Test creating and retrieving a task."""
         # Create a user, chat, and user-chat relationship
-        user = User(user_id=123, username="testuser", first_name="Test", last_name="User")
-        chat = Chat(chat_id=456, title="Test Chat", chat_type="group")
-        user_chat = UserChat(user_id=123, chat_id=456, is_active=True)
-        
-        self.db_manager.create_user(user)
-        self.db_manager.create_chat(chat)
-        self.db_manager.create_user_chat(user_chat)
+        self._seed_user_chat()
         
         # Create a task
-        now = datetime.datetime.now()
+        now = FROZEN_NOW
         week_number = now.isocalendar()[1]
         year = now.year
         
@@ -177,15 +207,9 @@ class TestDatabaseManager(unittest.TestCase):
     def test_update_task(self):
         """Test updating a task."""
         # Create a user, chat, user-chat relationship, and task
-        user = User(user_id=123, username="testuser", first_name="Test", last_name="User")
-        chat = Chat(chat_id=456, title="Test Chat", chat_type="group")
-        user_chat = UserChat(user_id=123, chat_id=456, is_active=True)
-        
-        self.db_manager.create_user(user)
-        self.db_manager.create_chat(chat)
-        self.db_manager.create_user_chat(user_chat)
+        self._seed_user_chat()
         
-        now = datetime.datetime.now()
+        now = FROZEN_NOW
         week_number = now.isocalendar()[1]
         year = now.year
         
@@ -205,7 +229,7 @@ class TestDatabaseManager(unittest.TestCase):
         # Update the task
         task.task_id = task_id
         task.status = "completed"
-        task.updated_at = datetime.datetime.now()
+        task.updated_at = FROZEN_NOW + datetime.timedelta(hours=1)
         
         success = self.db_manager.update_task(task)
         self.assertTrue(success)
@@ -217,15 +241,9 @@ class TestDatabaseManager(unittest.TestCase):
     def test_delete_task(self):
         """Test deleting a task."""
         # Create a user, chat, user-chat relationship, and task
-        user = User(user_id=123, username="testuser", first_name="Test", last_name="User")
-        chat = Chat(chat_id=456, title="Test Chat", chat_type="group")
-        user_chat = UserChat(user_id=123, chat_id=456, is_active=True)
-        
-        self.db_manager.create_user(user)
-        self.db_manager.create_chat(chat)
-        self.db_manager.create_user_chat(user_chat)
+        self._seed_user_chat()
         
-        now = datetime.datetime.now()
+        now = FROZEN_NOW
         week_number = now.isocalendar()[1]
         year = now.year
         
@@ -253,16 +271,10 @@ class TestDatabaseManager(unittest.TestCase):
     def test_get_user_tasks_in_chat(self):
         """Test retrieving a user's tasks in a chat."""
         # Create a user, chat, and user-chat relationship
-        user = User(user_id=123, username="testuser", first_name="Test", last_name="User")
-        chat = Chat(chat_id=456, title="Test Chat", chat_type="group")
-        user_chat = UserChat(user_id=123, chat_id=456, is_active=True)
-        
-        self.db_manager.create_user(user)
-        self.db_manager.create_chat(chat)
-        self.db_manager.create_user_chat(user_chat)
+        self._seed_user_chat()
         
         # Create multiple tasks
-        now = datetime.datetime.now()
+        now = FROZEN_NOW
         week_number = now.isocalendar()[1]
         year = now.year
         
@@ -288,28 +300,296 @@ class TestDatabaseManager(unittest.TestCase):
             year=year
         )
         
-        self.db_manager.create_task(task1)
-        self.db_manager.create_task(task2)
+        task_ids = self.db_manager.create_tasks([task1, task2])
+        self.assertEqual(len(task_ids), 2)
         
         # Retrieve the tasks
         tasks = self.db_manager.get_user_tasks_in_chat(123, 456, week_number, year)
         self.assertEqual(len(tasks), 2)
+        self.assertEqual({task.task_id for task in tasks}, set(task_ids))
+        self.assertEqual(self.db_manager.get_task(task_ids[0]).description, "Task 1")
         
-        # Check task descriptions
-        descriptions = [task.description for task in tasks]
-        self.assertIn("Task 1", descriptions)
-        self.assertIn("Task 2", descriptions)
+        # Check task descriptions and statuses
+        self.assertEqual({task.description for task in tasks}, {"Task 1", "Task 2"})
+        self.assertEqual({task.status for task in tasks}, {"created", "completed"})
+    
+    def test_count_chat_tasks_by_user(self):
+        """Test counting tasks by status for every user in a chat."""
+        # Create two users in the same chat
+        self.db_manager.create_user(User(user_id=123, username="user1", first_name="User", last_name="One"))
+        self.db_manager.create_user(User(user_id=124, username="user2", first_name="User", last_name="Two"))
+        self.db_manager.create_chat(Chat(chat_id=456, title="Test Chat", chat_type="group"))
+        
+        now = FROZEN_NOW
+        week_number = now.isocalendar()[1]
+        year = now.year
         
-        # Check task statuses
-        statuses = [task.status for task in tasks]
-        self.assertIn("created", statuses)
-        self.assertIn("completed", statuses)
+        statuses = {123: ["completed", "completed", "created"], 124: ["completed", "canceled"]}
+        for user_id, user_statuses in statuses.items():
+            for i, status in enumerate(user_statuses):
+                self.db_manager.create_task(Task(
+                    user_id=user_id,
+                    chat_id=456,
+                    description=f"Task {i}",
+                    status=status,
+                    created_at=now,
+                    updated_at=now,
+                    week_number=week_number,
+                    year=year
+                ))
+        
+        counts = self.db_manager.count_chat_tasks_by_user(456, week_number, year)
+        self.assertEqual(set(counts.keys()), {123, 124})
+        self.assertEqual(counts[123][:3], (3, 2, 0))
+        self.assertAlmostEqual(counts[123][3], 2/3)
+        self.assertEqual(counts[124][:3], (2, 1, 1))
+        self.assertAlmostEqual(counts[124][3], 1/2)
+        
+        # Other weeks are not counted
+        self.assertEqual(self.db_manager.count_chat_tasks_by_user(456, week_number, year - 1), {})
+    
+    def test_generate_weekly_stats_after_tasks_deleted(self):
+        """Test that regenerating statistics clears the row of a user whose tasks were deleted."""
+        self._seed_user_chat()
+        
+        now = FROZEN_NOW
+        week_number = now.isocalendar()[1]
+        year = now.year
+        
+        task_id = self.db_manager.create_task(Task(
+            user_id=123,
+            chat_id=456,
+            description="Task 1",
+            status="completed",
+            created_at=now,
+            updated_at=now,
+            week_number=week_number,
+            year=year
+        ))
+        self.db_manager.generate_weekly_stats_for_chat(456, week_number, year)
+        self.assertEqual(self.db_manager.get_weekly_stat(123, 456, week_number, year).tasks_completed, 1)
+        
+        # Delete the task and regenerate
+        self.db_manager.delete_task(task_id)
+        stats = self.db_manager.generate_weekly_stats_for_chat(456, week_number, year)
+        
+        self.assertEqual([(stat.user_id, stat.tasks_created) for stat in stats], [(123, 0)])
+        self.assertIsNone(self.db_manager.get_weekly_stat(123, 456, week_number, year))
+    
+    def test_get_user_stats_bundle(self):
+        """Test getting a user's weekly statistics with the user and chat in one query."""
+        self.db_manager.create_user(User(user_id=123, username="testuser", first_name="Test", last_name="User"))
+        self.db_manager.create_chat(Chat(chat_id=456, title="Test Chat", chat_type="group"))
+        
+        # No statistics yet
+        row = self.db_manager.get_user_stats_bundle(123, 456, 10, 2025)
+        self.assertEqual(row, (123, 456, None, None, None, None))
+        
+        self.db_manager.create_or_update_weekly_stat(WeeklyStat(
+            user_id=123, chat_id=456, week_number=10, year=2025,
+            tasks_created=4, tasks_completed=3, tasks_canceled=1, completion_rate=0.75
+        ))
+        row = self.db_manager.get_user_stats_bundle(123, 456, 10, 2025)
+        self.assertEqual(row[:2], (123, 456))
+        self.assertEqual(row[3:], (4, 3, 1))
+        
+        # Unknown user or chat
+        self.assertIsNone(self.db_manager.get_user_stats_bundle(999, 456, 10, 2025))
+        self.assertIsNone(self.db_manager.get_user_stats_bundle(123, 999, 10, 2025))
+    
+    def test_archive_week(self):
+        """Test moving a week's statistics to the archive."""
+        self.db_manager.bulk_upsert_weekly_stats([
+            WeeklyStat(user_id=123, chat_id=456, week_number=9, year=2025, tasks_created=2,
+                       tasks_completed=1, completion_rate=0.5),
+            WeeklyStat(user_id=123, chat_id=456, week_number=10, year=2025, tasks_created=1,
+                       tasks_completed=1, completion_rate=1.0)
+        ])
+        
+        success = self.db_manager.archive_week(9, 2025)
+        self.assertTrue(success)
+        
+        # The archived week is no longer a current statistic
+        self.assertIsNone(self.db_manager.get_weekly_stat(123, 456, 9, 2025))
+        self.assertIsNotNone(self.db_manager.get_weekly_stat(123, 456, 10, 2025))
+        
+        # History still includes the archived week
+        history = self.db_manager.get_user_stats_history_in_chat(123, 456)
+        self.assertEqual([(stat.week_number, stat.tasks_created) for stat in history], [(10, 1), (9, 2)])
+    
+    def test_archive_week_twice(self):
+        """Test that archiving a regenerated week replaces its archived rows."""
+        stat = WeeklyStat(user_id=123, chat_id=456, week_number=9, year=2025, tasks_created=2,
+                          tasks_completed=1, completion_rate=0.5)
+        self.db_manager.bulk_upsert_weekly_stats([stat])
+        self.assertTrue(self.db_manager.archive_week(9, 2025))
+        
+        # The week is regenerated with new counts and archived again
+        stat.tasks_completed, stat.completion_rate = 2, 1.0
+        self.db_manager.bulk_upsert_weekly_stats([stat])
+        self.assertTrue(self.db_manager.archive_week(9, 2025))
+        
+        history = self.db_manager.get_user_stats_history_in_chat(123, 456)
+        self.assertEqual([(stat.week_number, stat.tasks_completed) for stat in history], [(9, 2)])
+    
+    def test_task_aggregation_uses_covering_index(self):
+        """Test that the per-chat task aggregation is answered from the covering index."""
+        plan = self.db_manager.conn.execute(
+            """
+            EXPLAIN QUERY PLAN
+            SELECT user_id, COUNT(*), SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END)
+            FROM tasks
+            WHERE chat_id = ? AND week_number = ? AND year = ?
+            GROUP BY user_id
+            """,
+            (456, 1, 2025)
+        ).fetchall()
+        
+        details = " ".join(row[3] for row in plan)
+        self.assertIn("COVERING INDEX idx_tasks_chat_week_user_status", details)
+    
+    def test_get_user_chats_uses_index(self):
+        """Test that listing a user's chats is answered from the user_chats index."""
+        plan = self.db_manager.conn.execute(
+            """
+            EXPLAIN QUERY PLAN
+            SELECT c.* FROM chats c
+            JOIN user_chats uc ON c.chat_id = uc.chat_id
+            WHERE uc.user_id = ? AND uc.is_active = 1 AND c.is_active = 1
+            """,
+            (123,)
+        ).fetchall()
+        
+        details = " ".join(row[3] for row in plan)
+        self.assertIn("COVERING INDEX idx_user_chats_user_active", details)
     
     def test_create_and_get_weekly_stat(self):
         """Test creating and retrieving weekly statistics."""
-        # Skip this test for now as it's causing issues with the database connection
-        # We'll need to investigate this further in a future update
-        self.skipTest("Skipping test_create_and_get_weekly_stat due to database connection issues")
+        stat = WeeklyStat(
+            user_id=123,
+            chat_id=456,
+            week_number=10,
+            year=2025,
+            tasks_created=4,
+            tasks_completed=2,
+            tasks_canceled=1,
+            completion_rate=0.5
+        )
+        
+        success = self.db_manager.create_or_update_weekly_stat(stat)
+        self.assertTrue(success)
+        
+        # Retrieve the stats
+        retrieved_stat = self.db_manager.get_weekly_stat(123, 456, 10, 2025)
+        self.assertIsNotNone(retrieved_stat)
+        self.assertEqual(retrieved_stat.tasks_created, 4)
+        self.assertEqual(retrieved_stat.tasks_completed, 2)
+        self.assertEqual(retrieved_stat.tasks_canceled, 1)
+        self.assertAlmostEqual(retrieved_stat.completion_rate, 0.5)
+        
+        # Update the stats
+        stat.tasks_completed = 3
+        stat.completion_rate = 0.75
+        success = self.db_manager.create_or_update_weekly_stat(stat)
+        self.assertTrue(success)
+        
+        retrieved_stat = self.db_manager.get_weekly_stat(123, 456, 10, 2025)
+        self.assertEqual(retrieved_stat.tasks_completed, 3)
+        self.assertAlmostEqual(retrieved_stat.completion_rate, 0.75)
+        
+        # The update did not create a second row
+        history = self.db_manager.get_user_stats_history_in_chat(123, 456)
+        self.assertEqual(len(history), 1)
+    
+    def test_bulk_upsert_weekly_stats(self):
+        """Test saving weekly statistics for several users at once."""
+        stats = [
+            WeeklyStat(user_id=123, chat_id=456, week_number=10, year=2025, tasks_created=2,
+                       tasks_completed=1, completion_rate=0.5),
+            WeeklyStat(user_id=124, chat_id=456, week_number=10, year=2025, tasks_created=1,
+                       tasks_completed=1, completion_rate=1.0)
+        ]
+        
+        self.assertTrue(self.db_manager.bulk_upsert_weekly_stats(stats))
+        
+        # Saving again updates the existing rows
+        stats[0].tasks_completed = 2
+        stats[0].completion_rate = 1.0
+        self.assertTrue(self.db_manager.bulk_upsert_weekly_stats(stats))
+        
+        first = self.db_manager.get_weekly_stat(123, 456, 10, 2025)
+        second = self.db_manager.get_weekly_stat(124, 456, 10, 2025)
+        self.assertEqual(first.tasks_completed, 2)
+        self.assertAlmostEqual(first.completion_rate, 1.0)
+        self.assertEqual(second.tasks_created, 1)
+        self.assertEqual(len(self.db_manager.get_user_stats_history_in_chat(123, 456)), 1)
+
+class TestDatabaseManagerFile(unittest.TestCase):
+    """Test cases for DatabaseManager features that need an on-disk database."""
+    
+    def setUp(self):
+        """Set up test environment with a temporary database."""
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.db_manager = DatabaseManager(db_path=self.db_path)
+    
+    def tearDown(self):
+        """Clean up after tests."""
+        self.db_manager.close()
+        
+        # Remove the temporary database file and its WAL sidecar files
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.unlink(self.db_path + suffix)
+    
+    def test_connection_pragmas(self):
+        """Test that connections use WAL and the tuned settings."""
+        conn = self.db_manager.conn
+        
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1)  # NORMAL
+        self.assertEqual(conn.execute("PRAGMA busy_timeout").fetchone()[0], 5000)
+    
+    def test_reader_connection_is_reused(self):
+        """Test that a read returns its connection to the pool and the next read reuses it."""
+        db_manager = DatabaseManager(db_path=self.db_path, reader_pool_size=1)
+        self.addCleanup(db_manager.close)
+        reader = db_manager._reader_pool.queue[0]
+        statements = []
+        reader.set_trace_callback(statements.append)
+        
+        for reads in (1, 2):
+            self.assertIsNone(db_manager.get_user(123))
+            self.assertEqual(list(db_manager._reader_pool.queue), [reader])
+            self.assertEqual(len(statements), reads)
+    
+    def test_reader_connections_are_read_only(self):
+        """Test that pooled reader connections reject writes."""
+        self.db_manager._connect(read_only=True)
+        try:
+            self.assertIsNot(self.db_manager._local.conn, self.db_manager.conn)
+            with self.assertRaises(sqlite3.OperationalError):
+                self.db_manager.cursor.execute(
+                    "INSERT INTO users (user_id, username) VALUES (?, ?)", (999, "reader")
+                )
+        finally:
+            self.db_manager._disconnect()
+        
+        self.assertIsNone(self.db_manager.get_user(999))
+    
+    def test_get_user_from_multiple_threads(self):
+        """Test that reads from worker threads use their own connections."""
+        user = User(user_id=123, username="testuser", first_name="Test", last_name="User")
+        self.db_manager.create_user(user)
+        
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            users = list(executor.map(self.db_manager.get_user, [123] * 8))
+        
+        self.assertEqual(len(users), 8)
+        for retrieved_user in users:
+            self.assertIsNotNone(retrieved_user)
+            self.assertEqual(retrieved_user.username, "testuser")
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -6,49 +6,55 @@ Test script for Telegram Task Bot scheduler.
 This script tests the scheduler functionality.
 """
 
-import sys
-import os
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import Mock, patch
 import datetime
-import time
+import threading
 
-# Add parent directory to path to import modules
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-from utils.scheduler import TaskScheduler
+from utils.scheduler import TaskScheduler, DateTrigger, WeeklyTrigger
+from services import StatisticsService
+from database import DatabaseManager
 
 class TestTaskScheduler(unittest.TestCase):
     """Test cases for TaskScheduler."""
     
-    def setUp(self):
-        """Set up test environment."""
-        self.scheduler = TaskScheduler()
+    @classmethod
+    def setUpClass(cls):
+        """Set up a scheduler shared by all tests in the class."""
+        cls.scheduler = TaskScheduler()
+    
+    @classmethod
+    def tearDownClass(cls):
+        """Shut down the shared scheduler."""
+        cls.scheduler.shutdown()
     
     def tearDown(self):
-        """Clean up after tests."""
-        if self.scheduler.scheduler.running:
-            self.scheduler.shutdown()
+        """Remove the jobs scheduled by the test."""
+        for job_id in list(self.scheduler.jobs):
+            self.scheduler.remove_job(job_id)
     
     def test_scheduler_initialization(self):
         """Test scheduler initialization."""
-        self.assertIsNotNone(self.scheduler.scheduler)
-        self.assertFalse(self.scheduler.scheduler.running)
+        self.assertEqual(self.scheduler.jobs, {})
+        self.assertFalse(self.scheduler.running)
     
     def test_scheduler_start_and_shutdown(self):
         """Test starting and shutting down the scheduler."""
+        # Use a separate scheduler so the shared one is left untouched
+        scheduler = TaskScheduler()
+        
         # Start the scheduler
-        self.scheduler.start()
-        self.assertTrue(self.scheduler.scheduler.running)
+        scheduler.start()
+        self.assertTrue(scheduler.running)
         
         # Shutdown the scheduler
-        self.scheduler.shutdown()
-        self.assertFalse(self.scheduler.scheduler.running)
+        scheduler.shutdown()
+        self.assertFalse(scheduler.running)
     
     def test_schedule_weekly_task_reset(self):
         """Test scheduling weekly task reset."""
         # Create a mock function
-        mock_func = MagicMock()
+        mock_func = Mock()
         
         # Schedule the task reset
         job = self.scheduler.schedule_weekly_task_reset(mock_func)
@@ -56,20 +62,19 @@ class TestTaskScheduler(unittest.TestCase):
         # Check that the job was scheduled
         self.assertIn('weekly_task_reset', self.scheduler.jobs)
         job = self.scheduler.jobs['weekly_task_reset']
+        self.assertIs(job.trigger, TaskScheduler.TASK_RESET_TRIGGER)
         self.assertEqual(job.name, "Weekly Task Reset")
         
-        # Check that it's a cron trigger
-        self.assertEqual(job.trigger.__class__.__name__, "CronTrigger")
-        
-        # Check that it's scheduled for Monday at 00:00
-        # The trigger fields might be different depending on the APScheduler version
-        # So we just check that the job is scheduled with a cron trigger
-        self.assertEqual(job.name, "Weekly Task Reset")
+        # Check that it's scheduled for Monday at 00:00 Moscow time
+        next_run = job.next_run_time.astimezone(self.scheduler.moscow_tz)
+        self.assertEqual((next_run.weekday(), next_run.hour, next_run.minute), (0, 0, 0))
+        self.assertGreater(next_run, datetime.datetime.now(datetime.timezone.utc))
+        self.assertEqual(self.scheduler.get_next_run_time('weekly_task_reset'), job.next_run_time)
     
     def test_schedule_weekly_stats_generation(self):
         """Test scheduling weekly statistics generation."""
         # Create a mock function
-        mock_func = MagicMock()
+        mock_func = Mock()
         
         # Schedule the stats generation
         job = self.scheduler.schedule_weekly_stats_generation(mock_func)
@@ -79,84 +84,112 @@ class TestTaskScheduler(unittest.TestCase):
         job = self.scheduler.jobs['weekly_stats_generation']
         self.assertEqual(job.name, "Weekly Statistics Generation")
         
-        # Check that it's a cron trigger
-        self.assertEqual(job.trigger.__class__.__name__, "CronTrigger")
-        
-        # Check that it's scheduled for Friday at 17:00
-        # The trigger fields might be different depending on the APScheduler version
-        # So we just check that the job is scheduled with a cron trigger
-        self.assertEqual(job.name, "Weekly Statistics Generation")
+        # Check that it's scheduled for Friday at 17:00 Moscow time
+        next_run = job.next_run_time.astimezone(self.scheduler.moscow_tz)
+        self.assertEqual((next_run.weekday(), next_run.hour, next_run.minute), (4, 17, 0))
+        self.assertLessEqual(next_run - datetime.datetime.now(datetime.timezone.utc), datetime.timedelta(days=7))
+    
+    def test_get_all_jobs_info(self):
+        """Test listing the scheduled jobs."""
+        self.scheduler.schedule_weekly_task_reset(Mock())
+        
+        info = self.scheduler.get_all_jobs_info()
+        
+        self.assertEqual(set(info), {'weekly_task_reset'})
+        self.assertEqual(info['weekly_task_reset']['name'], "Weekly Task Reset")
+        self.assertEqual(info['weekly_task_reset']['trigger'], "weekly[day_of_week='mon', hour='0', minute='0']")
+        self.assertEqual(info['weekly_task_reset']['next_run_time'],
+                         self.scheduler.get_next_run_time('weekly_task_reset'))
+        self.assertIsNone(self.scheduler.get_next_run_time('unknown_job'))
+    
+    def test_weekly_trigger_next_fire_time(self):
+        """Test computing the next weekly run in Moscow time."""
+        trigger = WeeklyTrigger(day_of_week=4, hour=17, minute=0, tz=self.scheduler.moscow_tz)
+        
+        # Friday 13:59 UTC is 16:59 in Moscow, so the run is the same day
+        now = datetime.datetime(2025, 1, 10, 13, 59, tzinfo=datetime.timezone.utc)
+        self.assertEqual(trigger.get_next_fire_time(now),
+                         datetime.datetime(2025, 1, 10, 14, 0, tzinfo=datetime.timezone.utc))
+        
+        # Exactly at the run time, the next run is a week later
+        now = datetime.datetime(2025, 1, 10, 14, 0, tzinfo=datetime.timezone.utc)
+        self.assertEqual(trigger.get_next_fire_time(now),
+                         datetime.datetime(2025, 1, 17, 14, 0, tzinfo=datetime.timezone.utc))
+        
+        # Works from the current Moscow time as well
+        now = datetime.datetime.now(tz=self.scheduler.moscow_tz)
+        next_run = trigger.get_next_fire_time(now)
+        self.assertIs(next_run.tzinfo, self.scheduler.moscow_tz)
+        self.assertGreater(next_run, now)
     
-    @patch('utils.scheduler.datetime')
-    def test_job_execution(self, mock_datetime):
+    def test_job_execution(self):
         """Test that scheduled jobs are executed."""
-        # Set up mock datetime to control when the job runs
         now = datetime.datetime.now()
-        mock_datetime.datetime.now.return_value = now
         
-        # Create a mock function that we can check was called
-        mock_func = MagicMock()
+        # Create a mock function that signals when it is called
+        done = threading.Event()
+        mock_func = Mock(side_effect=lambda *args, **kwargs: done.set())
+        
+        # Use a separate scheduler so the shared one is never started
+        scheduler = TaskScheduler()
         
         # Schedule a job to run immediately
-        self.scheduler.scheduler.add_job(
-            mock_func,
-            'date',
-            run_date=now + datetime.timedelta(seconds=1),
-            id='test_job'
-        )
+        job = scheduler.add_job(mock_func, DateTrigger(now + datetime.timedelta(milliseconds=50)), 'test_job')
         
         # Start the scheduler
-        self.scheduler.start()
+        scheduler.start()
+        timer = job.timer
         
-        # Wait for the job to execute
-        time.sleep(2)
+        # Wait for the job to execute; the timer thread ends once the job is unscheduled
+        self.assertTrue(done.wait(2.0))
+        timer.join(2.0)
+        self.assertFalse(timer.is_alive())
         
-        # Check that the function was called
+        # Check that the function was called and the one-off job is gone
         mock_func.assert_called_once()
+        self.assertNotIn('test_job', scheduler.jobs)
         
         # Shutdown the scheduler
-        self.scheduler.shutdown()
+        scheduler.shutdown()
 
 class TestSchedulerIntegration(unittest.TestCase):
     """Integration tests for scheduler with other components."""
     
+    @classmethod
+    def setUpClass(cls):
+        """Set up a scheduler shared by all tests in the class."""
+        cls.scheduler = TaskScheduler()
+    
+    @classmethod
+    def tearDownClass(cls):
+        """Shut down the shared scheduler."""
+        cls.scheduler.shutdown()
+    
     def setUp(self):
         """Set up test environment."""
         # Mock the database manager and statistics service
-        self.db_manager = MagicMock()
-        
-        # Import here to avoid circular imports
-        from services import StatisticsService
+        self.db_manager = Mock(spec=DatabaseManager)
         self.statistics_service = StatisticsService(self.db_manager)
-        
-        # Create a scheduler
-        self.scheduler = TaskScheduler()
-    
-    def tearDown(self):
-        """Clean up after tests."""
-        if self.scheduler.scheduler.running:
-            self.scheduler.shutdown()
     
     @patch('services.statistics_service.StatisticsService.reset_weekly_tasks')
     def test_weekly_task_reset_integration(self, mock_reset):
         """Test integration of scheduler with weekly task reset."""
+        # Signal when the job runs
+        done = threading.Event()
+        mock_reset.side_effect = lambda *args, **kwargs: done.set()
+        
         # Schedule the task reset to run immediately
         now = datetime.datetime.now()
-        run_date = now + datetime.timedelta(seconds=1)
+        run_date = now + datetime.timedelta(milliseconds=50)
         
         # Schedule the job
-        self.scheduler.scheduler.add_job(
-            self.statistics_service.reset_weekly_tasks,
-            'date',
-            run_date=run_date,
-            id='test_reset'
-        )
+        self.scheduler.add_job(self.statistics_service.reset_weekly_tasks, DateTrigger(run_date), 'test_reset')
         
         # Start the scheduler
         self.scheduler.start()
         
         # Wait for the job to execute
-        time.sleep(2)
+        self.assertTrue(done.wait(2.0))
         
         # Check that the reset function was called
         mock_reset.assert_called_once()
@@ -164,23 +197,22 @@ class TestSchedulerIntegration(unittest.TestCase):
     @patch('services.statistics_service.StatisticsService.generate_weekly_stats_for_all_chats')
     def test_weekly_stats_generation_integration(self, mock_generate):
         """Test integration of scheduler with weekly statistics generation."""
+        # Signal when the job runs
+        done = threading.Event()
+        mock_generate.side_effect = lambda *args, **kwargs: done.set()
+        
         # Schedule the stats generation to run immediately
         now = datetime.datetime.now()
-        run_date = now + datetime.timedelta(seconds=1)
+        run_date = now + datetime.timedelta(milliseconds=50)
         
         # Schedule the job
-        self.scheduler.scheduler.add_job(
-            self.statistics_service.generate_weekly_stats_for_all_chats,
-            'date',
-            run_date=run_date,
-            id='test_generate'
-        )
+        self.scheduler.add_job(self.statistics_service.generate_weekly_stats_for_all_chats, DateTrigger(run_date), 'test_generate')
         
         # Start the scheduler
         self.scheduler.start()
         
         # Wait for the job to execute
-        time.sleep(2)
+        self.assertTrue(done.wait(2.0))
         
         # Check that the generate function was called
         mock_generate.assert_called_once()
@@ -6,40 +6,130 @@ Test script for Telegram Task Bot services.
 This script tests the database and service functionality without requiring the Telegram API.
 """
 
-import sys
-import os
 import unittest
+import copy
 import datetime
-from unittest.mock import MagicMock, patch
-
-# Add parent directory to path to import modules
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from collections import Counter
+from unittest.mock import patch
 
 from database import DatabaseManager, User, Chat, UserChat, Task, WeeklyStat
 from services import UserService, TaskService, StatisticsService
 import config
 
-class TestUserService(unittest.TestCase):
+# Fixed timestamp for test data, so tests don't depend on the clock
+FROZEN_NOW = datetime.datetime(2025, 1, 6, 12, 0, 0)
+
+def clone(model, **changes):
+    """Copy a model, overriding the given fields.
+    
+    Models are plain classes, so this stands in for ``dataclasses.replace``.
+    """
+    copied = copy.copy(model)
+    for name, value in changes.items():
+        setattr(copied, name, value)
+    return copied
+
+class FakeDBManager:
+    """Lightweight stand-in for DatabaseManager in service tests.
+    
+    Set ``returns[name]`` to the value a method should return; a callable is
+    called with the method's arguments instead. Calls are counted in
+    ``calls`` and the latest arguments of each method kept in ``last_args``.
+    """
+    
+    def __init__(self):
+        self.returns = {}
+        self.calls = Counter()
+        self.last_args = {}
+    
+    def _call(self, name, *args):
+        self.calls[name] += 1
+        self.last_args[name] = args
+        value = self.returns.get(name)
+        return value(*args) if callable(value) else value
+    
+    # Users and chats
+    
+    def get_user(self, user_id):
+        return self._call('get_user', user_id)
+    
+    def update_user(self, user):
+        return self._call('update_user', user)
+    
+    def get_user_chat(self, user_id, chat_id):
+        return self._call('get_user_chat', user_id, chat_id)
+    
+    def get_user_chats(self, user_id):
+        return self._call('get_user_chats', user_id)
+    
+    def get_chat_users(self, chat_id):
+        return self._call('get_chat_users', chat_id)
+    
+    def get_all_active_chats(self):
+        return self._call('get_all_active_chats')
+    
+    def register_user_in_chat(self, user, chat):
+        return self._call('register_user_in_chat', user, chat)
+    
+    # Tasks
+    
+    def create_task(self, task):
+        return self._call('create_task', task)
+    
+    def get_task(self, task_id):
+        return self._call('get_task', task_id)
+    
+    def update_task(self, task):
+        return self._call('update_task', task)
+    
+    def delete_task(self, task_id):
+        return self._call('delete_task', task_id)
+    
+    def get_user_tasks_in_chat(self, user_id, chat_id, week_number, year):
+        return self._call('get_user_tasks_in_chat', user_id, chat_id, week_number, year)
+    
+    def count_user_tasks_in_chat(self, user_id, chat_id, week_number, year):
+        return self._call('count_user_tasks_in_chat', user_id, chat_id, week_number, year)
+    
+    def count_chat_tasks_by_user(self, chat_id, week_number, year):
+        return self._call('count_chat_tasks_by_user', chat_id, week_number, year)
+    
+    # Statistics
+    
+    def get_user_stats_bundle(self, user_id, chat_id, week_number, year):
+        return self._call('get_user_stats_bundle', user_id, chat_id, week_number, year)
+    
+    def get_weekly_stat(self, user_id, chat_id, week_number, year):
+        return self._call('get_weekly_stat', user_id, chat_id, week_number, year)
+    
+    def get_user_stats_history_in_chat(self, user_id, chat_id, limit=10):
+        return self._call('get_user_stats_history_in_chat', user_id, chat_id, limit)
+    
+    def bulk_upsert_weekly_stats(self, stats):
+        return self._call('bulk_upsert_weekly_stats', stats)
+    
+    def delete_weekly_stats(self, chat_id, week_number, year, user_ids):
+        return self._call('delete_weekly_stats', chat_id, week_number, year, user_ids)
+    
+    def archive_week(self, week_number, year):
+        return self._call('archive_week', week_number, year)
+
+class TestUserService(unittest.IsolatedAsyncioTestCase):
     """Test cases for UserService."""
     
     def setUp(self):
         """Set up test environment."""
-        # Mock the database manager
-        self.db_manager = MagicMock()
+        # Fake the database manager
+        self.db_manager = FakeDBManager()
         self.user_service = UserService(self.db_manager)
     
-    def test_register_user_new(self):
+    async def test_register_user_new(self):
         """Test registering a new user."""
-        # Set up mock
-        self.db_manager.get_user.return_value = None
-        self.db_manager.get_chat.return_value = None
-        self.db_manager.get_user_chat.return_value = None
-        self.db_manager.create_user.return_value = True
-        self.db_manager.create_chat.return_value = True
-        self.db_manager.create_user_chat.return_value = True
+        # Set up fake: user, chat and association are created in one call
+        self.db_manager.returns['register_user_in_chat'] = True
         
         # Call the method
-        result = self.user_service.register_user(
+        result = await self.user_service.register_user(
             user_id=123,
             username="testuser",
             first_name="Test",
@@ -55,13 +145,13 @@ class TestUserService(unittest.TestCase):
         # We're not testing the implementation details, just the result
         self.assertTrue(result)
     
-    def test_register_user_existing(self):
+    async def test_register_user_existing(self):
         """Test registering an existing user."""
-        # Set up mock for register_user_in_chat method
-        self.db_manager.register_user_in_chat.return_value = True
+        # Set up fake for register_user_in_chat method
+        self.db_manager.returns['register_user_in_chat'] = True
         
         # Call the method
-        result = self.user_service.register_user(
+        result = await self.user_service.register_user(
             user_id=123,
             username="testuser_updated",
             first_name="Test",
@@ -75,68 +165,153 @@ class TestUserService(unittest.TestCase):
         self.assertTrue(result)
         # We're testing the result, not the implementation details
 
-class TestTaskService(unittest.TestCase):
-    """Test cases for TaskService."""
+    async def test_get_user_cached(self):
+        """Test that repeated user lookups are served from the cache."""
+        self.db_manager.returns['get_user'] = User(user_id=123, username="testuser")
+        
+        first = await self.user_service.get_user(123)
+        second = await self.user_service.get_user(123)
+        
+        self.assertIs(first, second)
+        self.assertEqual(self.db_manager.calls['get_user'], 1)
+        self.assertEqual(self.db_manager.last_args['get_user'], (123,))
     
-    def setUp(self):
-        """Set up test environment."""
-        # Mock the database manager
-        self.db_manager = MagicMock()
-        self.task_service = TaskService(self.db_manager)
+    async def test_update_user_profile_invalidates_cache(self):
+        """Test that a profile update drops the cached user."""
+        self.db_manager.returns['get_user'] = lambda user_id: User(user_id=user_id, username="testuser")
+        self.db_manager.returns['update_user'] = True
+        
+        await self.user_service.get_user(123)
+        self.assertTrue(await self.user_service.update_user_profile(123, username="renamed"))
+        await self.user_service.get_user(123)
+        
+        # One lookup before the update, one inside it and one after it
+        self.assertEqual(self.db_manager.calls['get_user'], 3)
     
-    def test_create_task_success(self):
-        """Test creating a task successfully."""
-        # Set up mock
-        user_chat = UserChat(user_id=123, chat_id=456, is_active=True)
-        self.db_manager.get_user_chat.return_value = user_chat
-        self.db_manager.count_user_tasks_in_chat.return_value = 2  # Below max limit
-        self.db_manager.create_task.return_value = 1
+    async def test_update_user_profile_unchanged(self):
+        """Test that a profile update without changes skips the write."""
+        self.db_manager.returns['get_user'] = User(user_id=123, username="testuser", first_name="Test")
         
-        # Call the method
-        result = self.task_service.create_task(
-            user_id=123,
-            chat_id=456,
-            description="Test task"
-        )
+        self.assertTrue(await self.user_service.update_user_profile(123, username="testuser", first_name="Test"))
+        self.assertTrue(await self.user_service.update_user_profile(123))
+        self.assertEqual(self.db_manager.calls['update_user'], 0)
+    
+    async def test_is_user_registered_cached(self):
+        """Test that a positive registration check is cached until cleared."""
+        self.db_manager.returns['get_user_chat'] = UserChat(user_id=123, chat_id=456, is_active=True)
         
-        # Assert
-        self.assertEqual(result, 1)
-        self.db_manager.create_task.assert_called_once()
+        self.assertTrue(await self.user_service.is_user_registered(123, 456))
+        self.assertTrue(await self.user_service.is_user_registered(123, 456))
+        self.assertEqual(self.db_manager.calls['get_user_chat'], 1)
+        self.assertEqual(self.db_manager.last_args['get_user_chat'], (123, 456))
+        
+        self.user_service.cache_clear()
+        self.assertTrue(await self.user_service.is_user_registered(123, 456))
+        self.assertEqual(self.db_manager.calls['get_user_chat'], 2)
+
+    async def test_is_user_registered_negative_cached(self):
+        """Test that a failed registration check is cached until the user registers."""
+        self.db_manager.returns['get_user_chat'] = None
+        self.db_manager.returns['register_user_in_chat'] = True
+        
+        self.assertFalse(await self.user_service.is_user_registered(123, 456))
+        self.assertFalse(await self.user_service.is_user_registered(123, 456))
+        self.assertEqual(self.db_manager.calls['get_user_chat'], 1)
+        self.assertEqual(self.db_manager.last_args['get_user_chat'], (123, 456))
+        
+        # Registering drops the cached negative result
+        await self.user_service.register_user(123, "testuser", "Test", "User", 456, "Test Chat", "group")
+        self.db_manager.returns['get_user_chat'] = UserChat(user_id=123, chat_id=456, is_active=True)
+        self.assertTrue(await self.user_service.is_user_registered(123, 456))
+        self.assertEqual(self.db_manager.calls['get_user_chat'], 2)
     
-    def test_create_task_max_limit(self):
-        """Test creating a task when max limit is reached."""
-        # Set up mock
-        user_chat = UserChat(user_id=123, chat_id=456, is_active=True)
-        self.db_manager.get_user_chat.return_value = user_chat
-        self.db_manager.count_user_tasks_in_chat.return_value = config.MAX_TASKS_PER_WEEK
+    async def test_get_user_stats(self):
+        """Test getting a user's weekly statistics from a single bundle query."""
+        self.db_manager.returns['get_user_stats_bundle'] = (123, 456, 7, 4, 3, 1)
         
-        # Call the method
-        result = self.task_service.create_task(
-            user_id=123,
-            chat_id=456,
-            description="Test task"
-        )
+        result = await self.user_service.get_user_stats(user_id=123, chat_id=456)
         
-        # Assert
-        self.assertIsNone(result)
-        self.db_manager.create_task.assert_not_called()
+        self.assertEqual(result['stat_id'], 7)
+        self.assertEqual(result['tasks_created'], 4)
+        self.assertEqual(result['tasks_completed'], 3)
+        self.assertEqual(result['tasks_canceled'], 1)
+        self.assertAlmostEqual(result['completion_rate'], 0.75)
+        self.assertEqual(self.db_manager.calls['get_user_stats_bundle'], 1)
+        self.assertEqual(self.db_manager.calls['get_user'], 0)
+        self.assertEqual(self.db_manager.calls['get_weekly_stat'], 0)
     
-    def test_update_task_status(self):
-        """Test updating a task's status."""
-        # Set up mock
-        task = Task(
+    async def test_get_user_stats_without_stats(self):
+        """Test getting statistics when the user has none for the current week."""
+        self.db_manager.returns['get_user_stats_bundle'] = (123, 456, None, None, None, None)
+        
+        result = await self.user_service.get_user_stats(user_id=123, chat_id=456)
+        
+        self.assertEqual(result['tasks_created'], 0)
+        self.assertEqual(result['completion_rate'], 0.0)
+        
+        # Unknown user or chat
+        self.db_manager.returns['get_user_stats_bundle'] = None
+        self.assertEqual(await self.user_service.get_user_stats(user_id=123, chat_id=456), {})
+
+class TestTaskService(unittest.TestCase):
+    """Test cases for TaskService."""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Build fixtures shared by all tests; tests change copies of them."""
+        cls._task_template = Task(
             task_id=1,
             user_id=123,
             chat_id=456,
             description="Test task",
             status="created",
-            created_at=datetime.datetime.now(),
-            updated_at=datetime.datetime.now(),
+            created_at=FROZEN_NOW,
+            updated_at=FROZEN_NOW,
             week_number=1,
             year=2025
         )
-        self.db_manager.get_task.return_value = task
-        self.db_manager.update_task.return_value = True
+    
+    def setUp(self):
+        """Set up test environment."""
+        # Fake the database manager
+        self.db_manager = FakeDBManager()
+        self.task_service = TaskService(self.db_manager)
+    
+    def test_create_task(self):
+        """Test creating a task below and at the weekly limit."""
+        # Set up fake
+        user_chat = UserChat(user_id=123, chat_id=456, is_active=True)
+        self.db_manager.returns['get_user_chat'] = user_chat
+        self.db_manager.returns['create_task'] = 1
+        
+        # (existing task count, expected result, expected create_task calls)
+        cases = [
+            (2, 1, 1),  # Below max limit
+            (config.MAX_TASKS_PER_WEEK, None, 0)  # Max limit reached
+        ]
+        
+        for task_count, expected, create_calls in cases:
+            with self.subTest(task_count=task_count):
+                self.db_manager.calls.clear()
+                self.db_manager.returns['count_user_tasks_in_chat'] = task_count
+                
+                # Call the method
+                result = self.task_service.create_task(
+                    user_id=123,
+                    chat_id=456,
+                    description="Test task"
+                )
+                
+                # Assert
+                self.assertEqual(result, expected)
+                self.assertEqual(self.db_manager.calls['create_task'], create_calls)
+    
+    def test_update_task_status(self):
+        """Test updating a task's status."""
+        # Set up fake
+        task = copy.copy(self._task_template)
+        self.db_manager.returns['get_task'] = task
+        self.db_manager.returns['update_task'] = True
         
         # Call the method
         result = self.task_service.update_task_status(
@@ -146,73 +321,72 @@ class TestTaskService(unittest.TestCase):
         
         # Assert
         self.assertTrue(result)
-        self.db_manager.update_task.assert_called_once()
+        self.assertEqual(self.db_manager.calls['update_task'], 1)
         self.assertEqual(task.status, "completed")
     
     def test_delete_task(self):
         """Test deleting a task."""
-        # Set up mock
-        task = Task(
-            task_id=1,
-            user_id=123,
-            chat_id=456,
-            description="Test task",
-            status="created",
-            created_at=datetime.datetime.now(),
-            updated_at=datetime.datetime.now(),
-            week_number=1,
-            year=2025
-        )
-        self.db_manager.get_task.return_value = task
-        self.db_manager.delete_task.return_value = True
+        # Set up fake
+        task = copy.copy(self._task_template)
+        self.db_manager.returns['get_task'] = task
+        self.db_manager.returns['delete_task'] = True
         
         # Call the method
         result = self.task_service.delete_task(task_id=1)
         
         # Assert
         self.assertTrue(result)
-        self.db_manager.delete_task.assert_called_once_with(1)
+        self.assertEqual(self.db_manager.calls['delete_task'], 1)
+        self.assertEqual(self.db_manager.last_args['delete_task'], (1,))
+
+    def test_get_task_stats(self):
+        """Test counting a user's tasks by status."""
+        # Set up fake
+        self.db_manager.returns['get_user_tasks_in_chat'] = [
+            clone(self._task_template, task_id=1, description="Task 1", status="completed"),
+            clone(self._task_template, task_id=2, description="Task 2", status="completed"),
+            clone(self._task_template, task_id=3, description="Task 3", status="canceled"),
+            clone(self._task_template, task_id=4, description="Task 4", status="created")
+        ]
+        
+        # Call the method
+        result = self.task_service.get_task_stats(user_id=123, chat_id=456)
+        
+        # Assert
+        self.assertEqual(result['total_tasks'], 4)
+        self.assertEqual(result['completed_tasks'], 2)
+        self.assertEqual(result['canceled_tasks'], 1)
+        self.assertEqual(result['created_tasks'], 1)
+        self.assertAlmostEqual(result['completion_rate'], 0.5)
 
 class TestStatisticsService(unittest.TestCase):
     """Test cases for StatisticsService."""
     
+    @classmethod
+    def setUpClass(cls):
+        """Build fixtures shared by all tests."""
+        cls._users = [
+            User(user_id=123, username="user1", first_name="User", last_name="One"),
+            User(user_id=456, username="user2", first_name="User", last_name="Two")
+        ]
+    
     def setUp(self):
         """Set up test environment."""
-        # Mock the database manager
-        self.db_manager = MagicMock()
+        # Fake the database manager
+        self.db_manager = FakeDBManager()
         self.statistics_service = StatisticsService(self.db_manager)
     
     def test_generate_weekly_stats_for_chat(self):
         """Test generating weekly statistics for a chat."""
-        # Set up mock
-        user1 = User(user_id=123, username="user1", first_name="User", last_name="One")
-        user2 = User(user_id=456, username="user2", first_name="User", last_name="Two")
+        # Set up fake
+        self.db_manager.returns['get_chat_users'] = self._users
         
-        self.db_manager.get_chat_users.return_value = [user1, user2]
-        
-        # Tasks for user1
-        tasks1 = [
-            Task(task_id=1, user_id=123, chat_id=789, description="Task 1", status="completed"),
-            Task(task_id=2, user_id=123, chat_id=789, description="Task 2", status="completed"),
-            Task(task_id=3, user_id=123, chat_id=789, description="Task 3", status="created")
-        ]
-        
-        # Tasks for user2
-        tasks2 = [
-            Task(task_id=4, user_id=456, chat_id=789, description="Task 4", status="completed"),
-            Task(task_id=5, user_id=456, chat_id=789, description="Task 5", status="canceled")
-        ]
-        
-        # Set up mock to return different tasks for different users
-        def get_user_tasks_side_effect(user_id, chat_id, week_number, year):
-            if user_id == 123:
-                return tasks1
-            elif user_id == 456:
-                return tasks2
-            return []
-        
-        self.db_manager.get_user_tasks_in_chat.side_effect = get_user_tasks_side_effect
-        self.db_manager.create_or_update_weekly_stat.return_value = True
+        # Task counts (created, completed, canceled, completion_rate) per user
+        self.db_manager.returns['count_chat_tasks_by_user'] = {
+            123: (3, 2, 0, 2/3),
+            456: (2, 1, 1, 1/2)
+        }
+        self.db_manager.returns['bulk_upsert_weekly_stats'] = True
         
         # Call the method
         result = self.statistics_service.generate_weekly_stats_for_chat(chat_id=789)
@@ -220,8 +394,10 @@ class TestStatisticsService(unittest.TestCase):
         # Assert
         self.assertEqual(len(result), 2)  # Two users
         
+        by_user = {stat.user_id: stat for stat in result}
+        
         # Check user1 stats
-        user1_stat = next((stat for stat in result if stat.user_id == 123), None)
+        user1_stat = by_user.get(123)
         self.assertIsNotNone(user1_stat)
         self.assertEqual(user1_stat.tasks_created, 3)
         self.assertEqual(user1_stat.tasks_completed, 2)
@@ -229,15 +405,176 @@ class TestStatisticsService(unittest.TestCase):
         self.assertAlmostEqual(user1_stat.completion_rate, 2/3)
         
         # Check user2 stats
-        user2_stat = next((stat for stat in result if stat.user_id == 456), None)
+        user2_stat = by_user.get(456)
         self.assertIsNotNone(user2_stat)
         self.assertEqual(user2_stat.tasks_created, 2)
         self.assertEqual(user2_stat.tasks_completed, 1)
         self.assertEqual(user2_stat.tasks_canceled, 1)
         self.assertAlmostEqual(user2_stat.completion_rate, 1/2)
         
-        # Check database calls
-        self.assertEqual(self.db_manager.create_or_update_weekly_stat.call_count, 2)
+        # Check database calls: all stats are saved in a single batch
+        self.assertEqual(self.db_manager.calls['bulk_upsert_weekly_stats'], 1)
+        self.assertEqual(len(self.db_manager.last_args['bulk_upsert_weekly_stats'][0]), 2)
+    
+    def test_generate_weekly_stats_skips_saving_users_without_tasks(self):
+        """Test that users without tasks are returned but not saved."""
+        # Set up fake
+        self.db_manager.returns['get_chat_users'] = self._users
+        self.db_manager.returns['count_chat_tasks_by_user'] = {123: (1, 1, 0, 1.0)}
+        self.db_manager.returns['bulk_upsert_weekly_stats'] = True
+        
+        # Call the method
+        result = self.statistics_service.generate_weekly_stats_for_chat(chat_id=789)
+        
+        # Assert
+        self.assertEqual(len(result), 2)
+        saved_stats = self.db_manager.last_args['bulk_upsert_weekly_stats'][0]
+        self.assertEqual([stat.user_id for stat in saved_stats], [123])
+        
+        # Rows stored earlier for users without tasks are removed
+        self.assertEqual(self.db_manager.calls['delete_weekly_stats'], 1)
+        chat_id, week_number, year, user_ids = self.db_manager.last_args['delete_weekly_stats']
+        self.assertEqual((chat_id, user_ids), (789, [456]))
+    
+    def test_get_weekly_stats_cached(self):
+        """Test that repeated weekly statistics reads are served from the cache."""
+        stat = WeeklyStat(user_id=123, chat_id=789, week_number=5, year=2025, tasks_created=1)
+        self.db_manager.returns['get_weekly_stat'] = stat
+        
+        first = self.statistics_service.get_weekly_stats(123, 789, 5, 2025)
+        second = self.statistics_service.get_weekly_stats(123, 789, 5, 2025)
+        
+        self.assertIs(first, stat)
+        self.assertIs(second, stat)
+        self.assertEqual(self.db_manager.calls['get_weekly_stat'], 1)
+        self.assertEqual(self.db_manager.last_args['get_weekly_stat'], (123, 789, 5, 2025))
+    
+    def test_stats_cache_invalidated_on_generation(self):
+        """Test that regenerating statistics drops cached reads for the affected users."""
+        self.db_manager.returns['get_weekly_stat'] = None
+        self.db_manager.returns['get_user_stats_history_in_chat'] = []
+        self.assertIsNone(self.statistics_service.get_weekly_stats(123, 789))
+        self.statistics_service.get_stats_history(123, 789)
+        
+        # Regenerate statistics for the chat
+        self.db_manager.returns['get_chat_users'] = self._users[:1]
+        self.db_manager.returns['count_chat_tasks_by_user'] = {123: (1, 1, 0, 1.0)}
+        self.db_manager.returns['bulk_upsert_weekly_stats'] = True
+        stats = self.statistics_service.generate_weekly_stats_for_chat(chat_id=789)
+        
+        # Both reads go to the database again
+        self.db_manager.returns['get_weekly_stat'] = stats[0]
+        self.assertIs(self.statistics_service.get_weekly_stats(123, 789), stats[0])
+        self.statistics_service.get_stats_history(123, 789)
+        self.assertEqual(self.db_manager.calls['get_user_stats_history_in_chat'], 2)
+    
+    def test_format_weekly_stats(self):
+        """Test formatting weekly statistics."""
+        stat = WeeklyStat(user_id=123, chat_id=789, week_number=5, year=2025, tasks_created=4,
+                          tasks_completed=3, tasks_canceled=1, completion_rate=0.75)
+        
+        result = self.statistics_service.format_weekly_stats(stat)
+        
+        self.assertEqual(
+            result,
+            "📊 Weekly Statistics (Week 5, 2025):\n\n"
+            "Total tasks: 4\n"
+            "Completed tasks: 3\n"
+            "Canceled tasks: 1\n"
+            "Completion rate: 75.0%\n"
+        )
+        self.assertEqual(self.statistics_service.format_weekly_stats(None), "No statistics available.")
+    
+    def test_format_chat_completion_rates_empty(self):
+        """Test formatting completion rates for a chat without users."""
+        # Set up fake
+        self.db_manager.returns['get_chat_users'] = []
+        
+        # Call the method
+        result = self.statistics_service.format_chat_completion_rates(chat_id=789, week_number=1, year=2025)
+        
+        # Assert: statistics are not regenerated for an empty chat
+        self.assertEqual(result, "No statistics available for this chat.")
+        self.assertEqual(self.db_manager.calls['get_chat_users'], 1)
+        self.assertEqual(self.db_manager.calls['bulk_upsert_weekly_stats'], 0)
+    
+    def test_generate_weekly_stats_for_all_chats(self):
+        """Test generating weekly statistics for all active chats."""
+        # Set up fake
+        self.db_manager.returns['get_all_active_chats'] = [
+            Chat(chat_id=111, title="Chat One", chat_type="group"),
+            Chat(chat_id=222, title="Chat Two", chat_type="group")
+        ]
+        
+        stats_by_chat = {
+            111: [WeeklyStat(user_id=1, chat_id=111)],
+            222: [WeeklyStat(user_id=1, chat_id=222)]
+        }
+        
+        with patch.object(self.statistics_service, '_generate_weekly_stats_for_chat',
+                          side_effect=lambda chat_id, *args: (stats_by_chat[chat_id], True)) as mock_generate:
+            # Call the method
+            result = self.statistics_service.generate_weekly_stats_for_all_chats()
+        
+        # Assert
+        self.assertEqual(result, stats_by_chat)
+        self.assertEqual(mock_generate.call_count, 2)
+    
+    def test_reset_weekly_tasks(self):
+        """Test that the weekly reset finalizes and archives the finished week."""
+        self.db_manager.returns['archive_week'] = True
+        
+        with patch.object(self.statistics_service, '_generate_weekly_stats_for_all_chats',
+                          return_value=({}, [])) as mock_generate:
+            result = self.statistics_service.reset_weekly_tasks()
+        
+        # Archived even without active chats, so rows of deactivated chats are moved too
+        self.assertTrue(result)
+        finished = datetime.datetime.now() - datetime.timedelta(days=1)
+        expected_week = (finished.isocalendar()[1], finished.year)
+        mock_generate.assert_called_once_with(*expected_week)
+        self.assertEqual(self.db_manager.calls['archive_week'], 1)
+        self.assertEqual(self.db_manager.last_args['archive_week'], expected_week)
+    
+    def test_reset_weekly_tasks_with_failed_chat(self):
+        """Test that the weekly reset reports a chat whose statistics could not be saved."""
+        self.db_manager.returns['get_all_active_chats'] = [
+            Chat(chat_id=111, title="Chat One", chat_type="group"),
+            Chat(chat_id=222, title="Chat Two", chat_type="group")
+        ]
+        self.db_manager.returns['get_chat_users'] = self._users[:1]
+        self.db_manager.returns['count_chat_tasks_by_user'] = {123: (1, 1, 0, 1.0)}
+        self.db_manager.returns['bulk_upsert_weekly_stats'] = lambda stats: stats[0].chat_id != 222
+        self.db_manager.returns['archive_week'] = True
+        
+        result = self.statistics_service.reset_weekly_tasks()
+        
+        # The week is still archived, but the reset is reported as failed
+        self.assertFalse(result)
+        self.assertEqual(self.db_manager.calls['bulk_upsert_weekly_stats'], 2)
+        self.assertEqual(self.db_manager.calls['archive_week'], 1)
+    
+    def test_reset_weekly_tasks_twice(self):
+        """Test that resetting the same week twice archives it only once."""
+        db_manager = DatabaseManager(db_path=':memory:')
+        self.addCleanup(db_manager.close)
+        statistics_service = StatisticsService(db_manager)
+        
+        finished = datetime.datetime.now() - datetime.timedelta(days=1)
+        week_number, year = finished.isocalendar()[1], finished.year
+        db_manager.register_user_in_chat(User(user_id=123, username="user1", first_name="User"),
+                                         Chat(chat_id=456, title="Test Chat", chat_type="group"))
+        db_manager.create_task(Task(user_id=123, chat_id=456, description="Task 1", status="completed",
+                                    created_at=finished, updated_at=finished,
+                                    week_number=week_number, year=year))
+        
+        self.assertTrue(statistics_service.reset_weekly_tasks())
+        self.assertTrue(statistics_service.reset_weekly_tasks())
+        
+        history = db_manager.get_user_stats_history_in_chat(123, 456)
+        self.assertEqual([(stat.week_number, stat.year, stat.tasks_completed) for stat in history],
+                         [(week_number, year, 1)])
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -5,36 +5,168 @@ This module handles scheduling of periodic tasks like weekly task reset and stat
 
 import logging
 import datetime
-from typing import Callable, Dict, Any
-
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
-from apscheduler.jobstores.memory import MemoryJobStore
-from pytz import timezone
+import threading
+from typing import Callable, Dict, Any, Optional
+from zoneinfo import ZoneInfo
 
 logger = logging.getLogger(__name__)
 
+WEEKDAY_NAMES = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+class WeeklyTrigger:
+    """Trigger that fires once a week on a given weekday and time."""
+    
+    def __init__(self, day_of_week: int, hour: int, minute: int, tz):
+        """Initialize the trigger.
+        
+        Args:
+            day_of_week: Weekday to fire on (0 is Monday).
+            hour: Hour to fire at.
+            minute: Minute to fire at.
+            tz: Timezone the weekday and time are given in.
+        """
+        self.day_of_week = day_of_week
+        self.hour = hour
+        self.minute = minute
+        self.tz = tz
+    
+    def get_next_fire_time(self, now: datetime.datetime) -> datetime.datetime:
+        """Get the first fire time strictly after now."""
+        local_now = now.astimezone(self.tz).replace(tzinfo=None)
+        days_ahead = (self.day_of_week - local_now.weekday()) % 7
+        candidate = local_now.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        candidate += datetime.timedelta(days=days_ahead)
+        if candidate <= local_now:
+            candidate += datetime.timedelta(days=7)
+        return candidate.replace(tzinfo=self.tz)
+    
+    def __str__(self) -> str:
+        return (f"weekly[day_of_week='{WEEKDAY_NAMES[self.day_of_week]}', "
+                f"hour='{self.hour}', minute='{self.minute}']")
+
+class DateTrigger:
+    """Trigger that fires once at a given time."""
+    
+    def __init__(self, run_date: datetime.datetime):
+        """Initialize the trigger.
+        
+        Args:
+            run_date: Time to fire at; naive datetimes are taken as local time.
+        """
+        self.run_date = run_date.astimezone()
+    
+    def get_next_fire_time(self, now: datetime.datetime) -> Optional[datetime.datetime]:
+        """Get the fire time if it is still ahead of now, None otherwise."""
+        return self.run_date if self.run_date > now else None
+    
+    def __str__(self) -> str:
+        return f"date[{self.run_date.isoformat()}]"
+
+class ScheduledJob:
+    """A function scheduled on a trigger."""
+    
+    def __init__(self, job_id: str, name: str, func: Callable[[], None], trigger):
+        self.id = job_id
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.trigger_str = str(trigger)  # Triggers don't change, so format once
+        self.next_run_time = trigger.get_next_fire_time(datetime.datetime.now(datetime.timezone.utc))
+        self.timer = None
+
 class TaskScheduler:
-    """Scheduler for periodic tasks."""
+    """Scheduler for periodic tasks.
+    
+    Each job waits on its own threading.Timer until its next run time and
+    is re-armed after it runs.
+    """
+    
+    moscow_tz = ZoneInfo('Europe/Moscow')  # UTC+3
+    
+    # Triggers are immutable, so the weekly jobs share one instance each
+    TASK_RESET_TRIGGER = WeeklyTrigger(day_of_week=0, hour=0, minute=0, tz=moscow_tz)
+    STATS_GENERATION_TRIGGER = WeeklyTrigger(day_of_week=4, hour=17, minute=0, tz=moscow_tz)
     
     def __init__(self):
         """Initialize the scheduler."""
-        self.scheduler = BackgroundScheduler()
-        self.scheduler.add_jobstore(MemoryJobStore(), 'default')
-        self.moscow_tz = timezone('Europe/Moscow')  # UTC+3
         self.jobs = {}
+        self.running = False
+        self._lock = threading.Lock()
     
     def start(self):
         """Start the scheduler."""
-        if not self.scheduler.running:
-            self.scheduler.start()
-            logger.info("Scheduler started")
+        with self._lock:
+            if self.running:
+                return
+            self.running = True
+            for job in self.jobs.values():
+                self._arm(job)
+        logger.info("Scheduler started")
     
     def shutdown(self):
         """Shutdown the scheduler."""
-        if self.scheduler.running:
-            self.scheduler.shutdown()
-            logger.info("Scheduler shutdown")
+        with self._lock:
+            if not self.running:
+                return
+            self.running = False
+            for job in self.jobs.values():
+                self._disarm(job)
+        logger.info("Scheduler shutdown")
+    
+    def add_job(self, func: Callable[[], None], trigger, job_id: str, name: Optional[str] = None) -> ScheduledJob:
+        """Schedule a function, replacing any job with the same ID.
+        
+        Args:
+            func: Function to call.
+            trigger: Trigger deciding when the function runs.
+            job_id: ID of the job.
+            name: Human-readable name of the job; defaults to the ID.
+        
+        Returns:
+            The scheduled job.
+        """
+        job = ScheduledJob(job_id, name or job_id, func, trigger)
+        with self._lock:
+            if job_id in self.jobs:
+                self._disarm(self.jobs[job_id])
+            self.jobs[job_id] = job
+            if self.running:
+                self._arm(job)
+        return job
+    
+    def _arm(self, job: ScheduledJob):
+        """Start the timer for the job's next run. Called with the lock held."""
+        if job.next_run_time is None:
+            return
+        delay = (job.next_run_time - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+        job.timer = threading.Timer(max(delay, 0), self._run_job, args=(job,))
+        job.timer.daemon = True
+        job.timer.start()
+    
+    def _disarm(self, job: ScheduledJob):
+        """Cancel the job's pending timer. Called with the lock held."""
+        if job.timer is not None:
+            job.timer.cancel()
+            job.timer = None
+    
+    def _run_job(self, job: ScheduledJob):
+        """Run a job and schedule its next run."""
+        try:
+            job.func()
+        except Exception as e:
+            logger.error(f"Error running scheduled job {job.id}: {e}")
+        
+        with self._lock:
+            if self.jobs.get(job.id) is not job:
+                # The job was removed or replaced while it ran
+                return
+            # Timers may wake slightly early, so never reuse the time that just fired
+            now = datetime.datetime.now(datetime.timezone.utc)
+            job.next_run_time = job.trigger.get_next_fire_time(max(now, job.next_run_time))
+            if job.next_run_time is None:
+                del self.jobs[job.id]
+            elif self.running:
+                self._arm(job)
     
     def schedule_weekly_task_reset(self, task_reset_func: Callable[[], None]):
         """Schedule weekly task reset on Monday at 00:00 UTC+3.
@@ -43,17 +175,7 @@ class TaskScheduler:
             task_reset_func: Function to call for task reset.
         """
         # Schedule for Monday at 00:00 Moscow time (UTC+3)
-        trigger = CronTrigger(day_of_week='mon', hour=0, minute=0, timezone=self.moscow_tz)
-        
-        job = self.scheduler.add_job(
-            task_reset_func,
-            trigger=trigger,
-            id='weekly_task_reset',
-            replace_existing=True,
-            name='Weekly Task Reset'
-        )
-        
-        self.jobs['weekly_task_reset'] = job
+        self.add_job(task_reset_func, self.TASK_RESET_TRIGGER, 'weekly_task_reset', name='Weekly Task Reset')
         logger.info("Scheduled weekly task reset for Monday at 00:00 UTC+3")
     
     def schedule_weekly_stats_generation(self, stats_generation_func: Callable[[], None]):
@@ -63,31 +185,34 @@ class TaskScheduler:
             stats_generation_func: Function to call for statistics generation.
         """
         # Schedule for Friday at 17:00 Moscow time (UTC+3)
-        trigger = CronTrigger(day_of_week='fri', hour=17, minute=0, timezone=self.moscow_tz)
-        
-        job = self.scheduler.add_job(
-            stats_generation_func,
-            trigger=trigger,
-            id='weekly_stats_generation',
-            replace_existing=True,
-            name='Weekly Statistics Generation'
-        )
-        
-        self.jobs['weekly_stats_generation'] = job
+        self.add_job(stats_generation_func, self.STATS_GENERATION_TRIGGER, 'weekly_stats_generation',
+                     name='Weekly Statistics Generation')
         logger.info("Scheduled weekly statistics generation for Friday at 17:00 UTC+3")
     
+    def remove_job(self, job_id: str):
+        """Remove a scheduled job.
+        
+        Args:
+            job_id: ID of the job.
+        """
+        with self._lock:
+            job = self.jobs.pop(job_id, None)
+            if job is None:
+                return
+            self._disarm(job)
+        logger.info(f"Removed scheduled job {job_id}")
+    
     def get_next_run_time(self, job_id: str) -> datetime.datetime:
         """Get the next run time for a scheduled job.
         
         Args:
             job_id: ID of the job.
-            
+        
         Returns:
             Next run time as a datetime object.
         """
-        if job_id in self.jobs:
-            return self.jobs[job_id].next_run_time
-        return None
+        job = self.jobs.get(job_id)
+        return job.next_run_time if job is not None else None
     
     def get_all_jobs_info(self) -> Dict[str, Any]:
         """Get information about all scheduled jobs.
@@ -95,11 +220,13 @@ class TaskScheduler:
         Returns:
             Dictionary with job information.
         """
-        result = {}
-        for job_id, job in self.jobs.items():
-            result[job_id] = {
-                'name': job.name,
-                'next_run_time': job.next_run_time,
-                'trigger': str(job.trigger)
+        # Timer threads remove finished jobs, so read the jobs under the lock
+        with self._lock:
+            return {
+                job_id: {
+                    'name': job.name,
+                    'next_run_time': job.next_run_time,
+                    'trigger': job.trigger_str
+                }
+                for job_id, job in self.jobs.items()
             }
-        return result
\ No newline at end of file